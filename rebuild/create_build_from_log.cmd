@@ -8,6 +8,9 @@
 findstr __BUILD_DATA_MAGIC_COOKIE__ %XML_PATH%.txt > %XML_PATH%
 
 @REM generate the equivalent Visual Studio build in a folder that is already gitignored anyway
+@REM set GODOT_REBUILD_FRAGMENTS to a directory (relative to the rebuild directory) to share generated files between checkouts
+@set FRAGMENT_STORE_OPTION=
+@if defined GODOT_REBUILD_FRAGMENTS set FRAGMENT_STORE_OPTION=--fragment-store "%GODOT_REBUILD_FRAGMENTS%"
 pushd ..\derammo_godot_tools\rebuild\
-python create_build_from_log.py ..\%XML_PATH% -S ..\..\%BASE_NAME% -B ..\..\%BASE_NAME% -M %2 --closed --edit-and-continue
+python create_build_from_log.py ..\%XML_PATH% -S ..\..\%BASE_NAME% -B ..\..\%BASE_NAME% -M %2 --closed --edit-and-continue %FRAGMENT_STORE_OPTION%
 popd
\ No newline at end of file
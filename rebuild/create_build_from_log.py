@@ -21,28 +21,36 @@
 # SOFTWARE.
 #
 import argparse
+import concurrent.futures
+import hashlib
+import math
+import mmap
 import os
 import pathlib
 import re
 import shutil
+import sys
 import uuid
 import bisect
 from dataclasses import dataclass, field
-from typing import Dict, Any, List
+from typing import Callable, Dict, Any, Iterable, Iterator, List, Tuple
 from xml.etree import ElementTree as xml
+from xml.sax.saxutils import unescape
 
 command_line = argparse.ArgumentParser(
     description="Generate Visual Studio native project files outside the source tree",
     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-command_line.add_argument('build_report_path', type=str,
-                          help='path to the XML build report (output from "scons xml=true platform=windows target=debug") to read')
+command_line.add_argument('build_report_path', type=str, nargs='+',
+                          help='paths to the XML build reports (output from "scons xml=true platform=windows target=debug") to read, one for each configuration to generate')
 command_line.add_argument('--source-repo-path', '-S', type=str, default='../godot/',
                           help='path to the repo; only the new solution file and binaries will be placed here')
 command_line.add_argument('--build-path', '-B', type=str, default='../godot_build/',
                           help='path to the build tree to generate; all project files and temporary output go here')
 command_line.add_argument('--closed', default=False, action='store_true', help='create one self-contained project file per module instead of the default inheritance tree')
-command_line.add_argument('--build-flavor', '-F', type=str, default=".windows.tools.x86_64",
-                          help='the decoration for binaries created by the build for which XML is provided')
+command_line.add_argument('--build-flavor', '-F', type=str, action='append',
+                          help='the decoration for binaries created by the build for which XML is provided, once for each build report in the same order (default: detected from the object files in the build report)')
+command_line.add_argument('--configuration', '-C', type=str, action='append',
+                          help='Visual Studio configuration name for each build report in the same order (default: derived from the build flavor, e.g. "Debug" for ".windows.tools.x86_64")')
 command_line.add_argument('--verbose', default=False, action='store_true', help='prints some more verbose output')
 command_line.add_argument('--vs-version', '-M', type=str, default='vs19',
                           help='version of Visual Studio templates to use, see templates folder')
@@ -58,8 +66,52 @@ command_line.add_argument('--flat-filters', default=False, action='store_true',
                           help='place files in "Source Files" and "Header Files" solution folders instead of according to file system hierarchy')
 command_line.add_argument('--merge', action='append',
                           help='each instance of this option will merge the specified module into a new module called "merged", to compile them together to make certain tools work (e.g. Visual Studio Class Diagrams)')
+command_line.add_argument('--timing-report', type=str,
+                          help='write a report of the slowest translation units, per-module totals and the link critical path of the first build report to this file, using the start/end times recorded by the patched SCons build')
+command_line.add_argument('--fragment-store', type=str,
+                          help='directory of generated project files keyed by a hash of their inputs, to share between checkouts and worktrees; files whose inputs are already in the store are hard linked (or copied) from it instead of generated again')
+command_line.add_argument('--balance-processors', type=int, default=0,
+                          help='enable multi-processor compilation in each project and share this many processors between projects according to the compile times recorded in the first build report')
+command_line.add_argument('--shard-sources', type=int, default=0,
+                          help='split each static library with more than this many translation units into several projects along directory boundaries, which are combined into the original library; 0 to disable')
+command_line.add_argument('--shard-bytes', type=int, default=0,
+                          help='like --shard-sources, but for the total size in bytes of the source files; 0 to disable')
+
+# subcommands that inspect build reports instead of generating projects; without one of these as the first
+# argument, the command line is the generator's
+subcommand_lines: Dict[str, argparse.ArgumentParser] = {}
+
+diff_command_line = argparse.ArgumentParser(
+    prog=f'{command_line.prog} diff',
+    description="Compare two XML build reports and list the translation units and modules whose settings changed",
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+diff_command_line.add_argument('old_report_path', type=str, help='path to the XML build report to compare against')
+diff_command_line.add_argument('new_report_path', type=str, help='path to the newer XML build report')
+subcommand_lines['diff'] = diff_command_line
 
-options = command_line.parse_args()
+query_command_line = argparse.ArgumentParser(
+    prog=f'{command_line.prog} query',
+    description="Print the build records for targets, sources or modules, using the side index written next to the build report",
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+query_command_line.add_argument('build_report_path', type=str, help='path to the XML build report to query')
+query_command_line.add_argument('keys', type=str, nargs='+',
+                                help='targets, source paths or module names to look up; a trailing part of a path such as "main\\node.cpp" is enough')
+query_command_line.add_argument('--field', '-f', type=str, action='append',
+                                help='only print this field of each record, e.g. "define", "include" or "libs"')
+subcommand_lines['query'] = query_command_line
+
+for subcommand_line in subcommand_lines.values():
+    subcommand_line.add_argument('--build-flavor', '-F', type=str, default=".windows.tools.x86_64",
+                                 help='the decoration for binaries created by the build for which XML is provided')
+    subcommand_line.add_argument('--verbose', default=False, action='store_true', help='prints some more verbose output')
+
+if len(sys.argv) > 1 and sys.argv[1] in subcommand_lines:
+    # start from the generator's defaults, so all the settings below exist for every command
+    options = subcommand_lines[sys.argv[1]].parse_args(sys.argv[2:], namespace=command_line.parse_args(['']))
+    options.command = sys.argv[1]
+else:
+    options = command_line.parse_args()
+    options.command = 'generate'
 
 # need trailing slashes, but don't make a root access by mistake!
 def sanitize_directory_path(path: str) -> str:
@@ -74,8 +126,9 @@ def sanitize_directory_path(path: str) -> str:
 
 options.source_repo_path = sanitize_directory_path(options.source_repo_path)
 options.build_path = sanitize_directory_path(options.build_path)
-options.repo_name = pathlib.Path(options.source_repo_path).name
+# GUIDs only depend on the module, so every checkout generates the same files
 options.project_guid_namespace = uuid.UUID(int=0x1337)
+options.filter_guid_namespace = uuid.uuid5(options.project_guid_namespace, 'filters')
 
 # Set up flags/settings processing, which only changes the build when requested, so that by default
 # it will be the same as what SCons made.
@@ -97,9 +150,6 @@ if options.in_tree:
 if options.merge:
     raise NotImplementedError("--merge")
 
-if options.build_flavor != ".windows.tools.x86_64":
-    raise NotImplementedError("--build-flavor")
-
 
 # create all nodes in this namespace
 PROJECT_NAMESPACE = "http://schemas.microsoft.com/developer/msbuild/2003"
@@ -111,11 +161,19 @@ CXX_PROJECT_TYPE = "{8BC9CEB8-8B4A-11D0-8D11-00A0C91BC942}"
 # MS XML values for -W0|-w, -W1, ...
 WARNING_LEVELS = ['TurnOffAllWarnings', 'Level1', 'Level2', 'Level3', 'Level4', 'Level5']
 
-# master info read from XML
-cc = {}
-cxx = {}
-ar = {}
-link = {}
+# Visual Studio configuration names for the build flavors of the usual SCons builds; other flavors get a name made
+# from their decoration
+FLAVOR_CONFIGURATIONS = {
+    '.windows.tools.x86_64': 'Debug',
+    '.windows.opt.tools.x86_64': 'ReleaseDebug',
+    '.windows.opt.x86_64': 'Release',
+}
+
+# the only platform supported so far
+PLATFORM = 'x64'
+
+# XML entities that the build report may contain, in addition to &amp; &lt; &gt;
+XML_ENTITIES = {'&quot;': '"', '&apos;': "'"}
 
 
 def get_root_dir(version: str) -> str:
@@ -147,15 +205,42 @@ class ModuleInfo(TargetInfo):
     # NOTE: this is the master collection
     sources: Dict[str, Dict] = field(default_factory=dict)
 
+    # decoration of the libraries built in the same configuration
+    build_flavor: str = ''
+
     # indexed by actual XML name of the type of item to create in the project
     other_items: Dict[str, List[str]] = field(default_factory=dict)
 
+    # number of processors for /MP, or 0 to leave unset
+    processor_number: int = 0
+
+    # projects whose libraries this module's library combines, if it was split by --shard-sources or --shard-bytes
+    shards: List[str] = field(default_factory=list)
+
     opaque_objects: List[str] = field(default_factory=list)
     src_includes: Dict[str, Dict[str, Dict]] = field(default_factory=dict)
     src_defines: Dict[str, Dict[str, Dict]] = field(default_factory=dict)
     obj_lib_settings: Dict[str, Dict[str, Dict]] = field(default_factory=dict)
 
 
+# everything read from the build report for one configuration
+@dataclass
+class Configuration:
+    report_path: str
+    name: str = ''
+    build_flavor: str = ''
+
+    # master info read from XML
+    cc: Dict[str, Dict] = field(default_factory=dict)
+    cxx: Dict[str, Dict] = field(default_factory=dict)
+    ar: Dict[str, Dict] = field(default_factory=dict)
+    link: Dict[str, Dict] = field(default_factory=dict)
+
+    @property
+    def condition(self) -> str:
+        return f'{self.name}|{PLATFORM}'
+
+
 def recreate_build_tree():
     if options.dry_run:
         return
@@ -166,27 +251,162 @@ def recreate_build_tree():
     shutil.copytree(f'templates/{options.vs_version}/{get_root_dir(options.vs_version)}', output_path)
 
 
-# master db
-modules: Dict[str, ModuleInfo] = {}
+# one for each build report, in the order given
+configurations: List[Configuration] = []
+
+# master db, with each module's info for every configuration that builds it, keyed by condition
+modules: Dict[str, Dict[str, ModuleInfo]] = {}
+
+# Flags, defines, include and library paths repeat across almost all records and across the build reports for the
+# different configurations.  decoded_fields is per process: each worker process decodes a distinct value once for its
+# own report, and the main process once for all reports when it reads them itself.  processed_settings is only used
+# in the main process, so each distinct value is processed once for all configurations.
+decoded_fields: Dict[bytes, str] = {}
+processed_settings: Dict[Tuple[Callable, str, bool], str] = {}
+
+# number of entries in each list in the timing report
+TIMING_REPORT_LENGTH = 50
+
+# fields of a build record that record when it ran rather than what it built
+TIMING_FIELDS = ['start', 'end']
+
+
+# attributes of the Project element in every generated file
+project_attributes: Dict[str, str] = {}
+
+
+# line break and indentation before an element at each depth, as xml.indent would make it
+INDENTATIONS = ['\n' + '  ' * depth for depth in range(64)]
 
 
-def create_project():
-    return xml.parse(f'templates/{options.vs_version}/include_project.xml')
+# Streams an MSBuild project as indented XML with CRLF line endings, exactly as ElementTree would write it after
+# xml.indent, without building the tree.  It takes the same calls as ProjectBuilder, so the same code can write a
+# document straight to a file or collect it for merging with other configurations.
+class ProjectWriter:
+    def __init__(self, attributes: Dict[str, str]):
+        self.parts = ['<?xml version="1.0" encoding="utf-8"?>\n<Project', f' xmlns="{PROJECT_NAMESPACE}"',
+                      format_attributes(attributes)]
+        # the start tag of the last element started is still open until we know whether it has children
+        self.open = True
+        self.text = None
+        self.depth = 1
 
+    def start(self, tag: str, attributes: Dict[str, str] | None = None):
+        if self.open:
+            self.parts.append('>')
+        self.parts.append(f'{INDENTATIONS[self.depth]}<{tag}{format_attributes(attributes)}')
+        self.open = True
+        self.text = None
+        self.depth += 1
 
-def write_to_file(path, doc):
-    xml.indent(doc)
+    def data(self, text: str):
+        self.text = text if self.text is None else self.text + text
+
+    def end(self, tag: str):
+        self.depth -= 1
+        if not self.open:
+            self.parts.append(f'{INDENTATIONS[self.depth]}</{tag}>')
+        elif self.text:
+            self.parts.append(f'>{escape_text(self.text)}</{tag}>')
+        else:
+            self.parts.append(' />')
+        self.open = False
+        self.text = None
+
+    # an element without children, which is most of them
+    def element(self, tag: str, text: str | None = None, attributes: Dict[str, str] | None = None):
+        if self.open:
+            self.parts.append('>')
+            self.open = False
+        if text:
+            self.parts.append(f'{INDENTATIONS[self.depth]}<{tag}{format_attributes(attributes)}>{escape_text(text)}</{tag}>')
+        else:
+            self.parts.append(f'{INDENTATIONS[self.depth]}<{tag}{format_attributes(attributes)} />')
+
+    def getvalue(self) -> bytes:
+        # an empty project keeps the line break from the template
+        self.parts.append('>\n</Project>' if self.open else '\n</Project>')
+        self.open = False
+        return fix_line_endings(''.join(self.parts)).encode('utf-8', 'xmlcharrefreplace')
+
+
+# collects the calls to a ProjectWriter as elements, for documents that are merged before writing
+class ProjectBuilder(xml.TreeBuilder):
+    def start(self, tag: str, attributes: Dict[str, str] | None = None):
+        return super().start(tag, attributes or {})
+
+    def element(self, tag: str, text: str | None = None, attributes: Dict[str, str] | None = None):
+        self.start(tag, attributes)
+        if text:
+            self.data(text)
+        self.end(tag)
+
+
+def format_attributes(attributes: Dict[str, str] | None) -> str:
+    if not attributes:
+        return ''
+    return ''.join([f' {name}="{escape_attribute(value)}"' for name, value in attributes.items()])
+
+
+# same escaping as ElementTree
+def escape_text(text: str) -> str:
+    if '&' in text:
+        text = text.replace('&', '&amp;')
+    if '<' in text:
+        text = text.replace('<', '&lt;')
+    if '>' in text:
+        text = text.replace('>', '&gt;')
+    return text
+
+
+def escape_attribute(text: str) -> str:
+    text = escape_text(text)
+    if '"' in text:
+        text = text.replace('"', '&quot;')
+    if '\r' in text:
+        text = text.replace('\r', '&#13;')
+    if '\n' in text:
+        text = text.replace('\n', '&#10;')
+    if '\t' in text:
+        text = text.replace('\t', '&#09;')
+    return text
+
+
+# writes an element and its children, dropping the namespace that parsed elements have on their tags
+def write_element(writer, element: xml.Element):
+    tag = element.tag.rpartition('}')[2]
+    if len(element) == 0:
+        writer.element(tag, element.text, element.attrib)
+        return
+    writer.start(tag, element.attrib)
+    for child in element:
+        write_element(writer, child)
+    writer.end(tag)
+
+
+def create_project() -> ProjectWriter:
+    if not project_attributes:
+        project_attributes.update(xml.parse(f'templates/{options.vs_version}/include_project.xml').getroot().attrib)
+    return ProjectWriter(project_attributes)
+
+
+def write_to_file(path, writer: ProjectWriter):
+    content = writer.getvalue()
     if options.dry_run:
         return
+    # don't write through a hard link into the fragment store
+    if os.path.lexists(path):
+        os.remove(path)
+    # NOTE: the xml header has double quotes, because Visual Studio won't like single quotes and will change them,
+    # making the project file dirty.
     with open(path, "wb") as output:
-        output.write('<?xml version="1.0" encoding="utf-8"?>\n'.encode('utf-8'));
-        # WARNING: don't let this write the xml header, because Visual Studio won't like the
-        # single quotes and will change them, making the project file dirty.
-        doc.write(
-            output,
-            encoding='utf-8',
-            method='xml')
-    fix_line_endings_in_place(path)
+        output.write(content)
+
+
+def fix_line_endings(content):
+    content = content.replace('\r\r', '\r')
+    content = content.replace('\r\n', '\n')
+    return content.replace('\n', '\r\n')
 
 
 def fix_line_endings_in_place(path):
@@ -203,20 +423,17 @@ def fix_line_endings_in_place(path):
 # because otherwise IDE will add it and want to save the project file
 # TODO CHECK if this still happens since we fixed the guid capitalization and quotes
 def write_project(path, path_relative_to_source_repo, project_namespace):
-    doc = create_project()
-    project = doc.getroot()
-    property_group = xml.SubElement(project, 'PropertyGroup')
-    guid_element = xml.SubElement(property_group, 'ProjectGuid')
-    guid = str(uuid.uuid5(options.project_guid_namespace, "%s/%s" % (options.repo_name, path_relative_to_source_repo))).upper()
-    guid_element.text = f'{{{guid}}}'
-    namespace = xml.SubElement(property_group, 'RootNamespace')
-    namespace.text = project_namespace
-    source_tree_path = xml.SubElement(property_group, 'ParentPathInSourceTree')
-    source_tree_path.text = f'$(SolutionDir)\\{pathlib.Path(path_relative_to_source_repo).parent}\\'
-    write_to_file(path, doc)
-
-
-def build_additional(parent, element_tag, flags_dictionary, condition=None):
+    writer = create_project()
+    writer.start('PropertyGroup')
+    guid = str(uuid.uuid5(options.project_guid_namespace, path_relative_to_source_repo)).upper()
+    writer.element('ProjectGuid', f'{{{guid}}}')
+    writer.element('RootNamespace', project_namespace)
+    writer.element('ParentPathInSourceTree', f'$(SolutionDir)\\{pathlib.Path(path_relative_to_source_repo).parent}\\')
+    writer.end('PropertyGroup')
+    write_to_file(path, writer)
+
+
+def build_additional(writer, element_tag, flags_dictionary, condition=None):
     if len(flags_dictionary) < 1:
         return
     all_settings = ""
@@ -224,107 +441,165 @@ def build_additional(parent, element_tag, flags_dictionary, condition=None):
         all_settings += settings
         all_settings += " "
 
+    attributes = {'Condition': f"'$(Configuration)|$(Platform)'=='{condition}'"} if condition else None
+
     # fix special cases that happen all the time and have no impact:
     if element_tag == 'AdditionalOptions':
-        warning_level_element = None
         warning_level = re.search('/W([0-9]) ', all_settings)
         if warning_level:
             # don't pointlessly set /w or /W0 and then override with higher warning level
             all_settings = re.sub('/w |/W[0-9] ', '', all_settings)
 
             # convert to XML setting to avoid override warnings
-            warning_level_element = xml.SubElement(parent, "WarningLevel")
-            warning_level_element.text = f'{WARNING_LEVELS[int(warning_level.group(1))]}'
+            writer.element('WarningLevel', f'{WARNING_LEVELS[int(warning_level.group(1))]}', attributes)
         if re.search('/w ', all_settings):
             # must have been present without any /W
             all_settings = re.sub('/w ', '', all_settings)
             # convert to XML setting to avoid override warnings
-            warning_level_element = xml.SubElement(parent, "WarningLevel")
-            warning_level_element.text = f'{WARNING_LEVELS[0]}'
-        if condition and warning_level_element != None:
-            warning_level_element.set('Condition', f"'$(Configuration)|$(Platform)'=='{condition}'")
+            writer.element('WarningLevel', f'{WARNING_LEVELS[0]}', attributes)
 
-    additional_options = xml.SubElement(parent, element_tag)
-    if condition:
-        additional_options.set('Condition', f"'$(Configuration)|$(Platform)'=='{condition}'")
-    additional_options.text = all_settings
+    writer.element(element_tag, all_settings, attributes)
 
 
 # NOTE: this includes both compiled and opaque obj sources as well as headers, natvis, etc.
-def write_sources(path, module: ModuleInfo, condition=None):
-    doc = create_project()
-    project = doc.getroot()
-    item_group = xml.SubElement(project, 'ItemGroup')
-    if condition:
-        item_group.set('Condition', f"'$(Configuration)|$(Platform)'=='{condition}'")
+def create_sources(writer, path, module: ModuleInfo):
+    writer.start('ItemGroup')
     solution_root = pathlib.Path(os.path.relpath(options.source_repo_path, str(pathlib.Path(path).parent)))
     for compile_path, override_flags in module.sources.items():
-        clcompile = xml.SubElement(item_group, 'ClCompile')
-        clcompile.set('Include', str(solution_root / compile_path))
+        writer.start('ClCompile', {'Include': str(solution_root / compile_path)})
         if compile_path in module.src_defines:
-            build_additional(clcompile, 'PreprocessorDefinitions', module.src_defines[compile_path])
+            build_additional(writer, 'PreprocessorDefinitions', module.src_defines[compile_path])
         if len(override_flags) > 0:
-            build_additional(clcompile, 'AdditionalOptions', override_flags)
+            build_additional(writer, 'AdditionalOptions', override_flags)
         if compile_path in module.src_includes:
-            build_additional(clcompile, 'AdditionalIncludeDirectories', module.src_includes[compile_path])
+            build_additional(writer, 'AdditionalIncludeDirectories', module.src_includes[compile_path])
+        writer.end('ClCompile')
+    writer.end('ItemGroup')
 
     for item_type in module.other_items.keys():
-        other = xml.SubElement(project, 'ItemGroup')
-        if condition:
-            other.set('Condition', f"'$(Configuration)|$(Platform)'=='{condition}'")
+        writer.start('ItemGroup')
         for item_path in module.other_items[item_type]:
-            xml.SubElement(other, item_type, { 'Include': str(solution_root / item_path) })
-
-    write_to_file(path, doc)
+            writer.element(item_type, attributes={'Include': str(solution_root / item_path)})
+        writer.end('ItemGroup')
 
 
-def write_module_settings(path, module: ModuleInfo, condition=None):
-    doc = create_project()
-    project = doc.getroot()
-    item_definition_group = xml.SubElement(project, 'ItemDefinitionGroup')
-    if condition:
-        item_definition_group.set('Condition', f"'$(Configuration)|$(Platform)'=='{condition}'")
-    clcompile = xml.SubElement(item_definition_group, 'ClCompile')
-    build_additional(clcompile, 'PreprocessorDefinitions', module.defines)
+def create_module_settings(writer, module: ModuleInfo):
+    writer.start('ItemDefinitionGroup')
+    writer.start('ClCompile')
+    build_additional(writer, 'PreprocessorDefinitions', module.defines)
     if module.compile_settings:
-        build_additional(clcompile, 'AdditionalOptions', module.compile_settings)
+        build_additional(writer, 'AdditionalOptions', module.compile_settings)
     if module.includes:
-        build_additional(clcompile, 'AdditionalIncludeDirectories', module.includes)
+        build_additional(writer, 'AdditionalIncludeDirectories', module.includes)
     for compile_setting_name, compile_setting_value in settings_processing.module_compile_xml.items():
-        compile_setting = xml.SubElement(clcompile, compile_setting_name)
-        compile_setting.text = compile_setting_value
+        writer.element(compile_setting_name, compile_setting_value)
+    if module.processor_number > 0:
+        writer.element('MultiProcessorCompilation', 'true')
+        writer.element('ProcessorNumber', str(module.processor_number))
+    writer.end('ClCompile')
     if len(module.lib_settings) > 0:
-        lib = xml.SubElement(item_definition_group, 'Lib')
-        build_additional(lib, 'AdditionalOptions', module.lib_settings)
-    xml.indent(doc)
-    write_to_file(path, doc)
-
-
-def write_module_libraries(path, module: ModuleInfo, condition=None):
-    doc = create_project()
-    project = doc.getroot()
-    item_definition_group = xml.SubElement(project, 'ItemDefinitionGroup')
-    if condition:
-        item_definition_group.set('Condition', f"'$(Configuration)|$(Platform)'=='{condition}'")
-    link = xml.SubElement(item_definition_group, 'Link')
-    additional_dependencies = xml.SubElement(link, 'AdditionalDependencies')
-    additional_dependencies.text = ';'.join(module.other_libraries)
+        writer.start('Lib')
+        build_additional(writer, 'AdditionalOptions', module.lib_settings)
+        writer.end('Lib')
+    writer.end('ItemDefinitionGroup')
+
+
+def create_module_libraries(writer, module: ModuleInfo):
+    writer.start('ItemDefinitionGroup')
+    writer.start('Link')
+    writer.element('AdditionalDependencies', ';'.join(module.other_libraries))
     # NOTE: no %(AdditionalDependencies) since we don't use the defaults, just what the xml says
 
     # attach linker flags
     if 'linkflags' in module.data:
-        build_additional(link, 'AdditionalOptions', {'linkflags': module.data['linkflags']})
+        build_additional(writer, 'AdditionalOptions', {'linkflags': module.data['linkflags']})
 
     if len(module.libpaths) > 0:
-        additional_library_directories = xml.SubElement(link, 'AdditionalLibraryDirectories')
-        additional_library_directories.text = module.libpaths
-
-    write_to_file(path, doc)
+        writer.element('AdditionalLibraryDirectories', module.libpaths)
+    writer.end('Link')
+    writer.end('ItemDefinitionGroup')
+
+
+def get_condition_expression(conditions: List[str]) -> str:
+    return ' or '.join(f"'$(Configuration)|$(Platform)'=='{condition}'" for condition in conditions)
+
+
+# identifies the same element in the documents for different configurations: items by what they include, groups by
+# what kind of items or settings they hold, and settings by name
+def get_merge_key(element: xml.Element) -> Tuple:
+    if 'Include' in element.attrib:
+        return element.tag, element.attrib['Include']
+    if len(element) > 0:
+        return element.tag, element[0].tag
+    return element.tag,
+
+
+# Adds the children of each configuration's element to parent.  Whatever all configurations agree on is added once
+# without a condition, and only the differences get a condition naming the configurations they apply to.
+def merge_configurations(parent: xml.Element, variants: Dict[str, xml.Element], conditions: List[str]):
+    merged: Dict[Tuple, Dict[str, xml.Element]] = {}
+    for condition, element in variants.items():
+        occurrences = {}
+        for child in element:
+            key = get_merge_key(child)
+            occurrences[key] = occurrences.get(key, 0) + 1
+            merged.setdefault(key + (occurrences[key],), {})[condition] = child
+
+    for children in merged.values():
+        first = next(iter(children.values()))
+        if len(children) == len(conditions) and all(is_same_element(first, child) for child in children.values()):
+            # most of a module is the same in every configuration, so it is taken over as it is
+            parent.append(first)
+            continue
+        if 'Include' in first.attrib or any(len(child) > 0 for child in children.values()):
+            element = xml.SubElement(parent, first.tag, first.attrib)
+            if len(children) < len(conditions):
+                element.set('Condition', get_condition_expression(list(children.keys())))
+            merge_configurations(element, children, list(children.keys()))
+            continue
+        values: Dict[str, List[str]] = {}
+        for condition, child in children.items():
+            values.setdefault(child.text, []).append(condition)
+        for text, value_conditions in values.items():
+            element = xml.SubElement(parent, first.tag, first.attrib)
+            element.text = text
+            if len(value_conditions) < len(conditions):
+                element.set('Condition', get_condition_expression(value_conditions))
+
+
+def is_same_element(first: xml.Element, second: xml.Element) -> bool:
+    if first is second:
+        return True
+    if first.tag != second.tag or first.text != second.text or first.attrib != second.attrib or len(first) != len(second):
+        return False
+    return all(is_same_element(first_child, second_child) for first_child, second_child in zip(first, second))
+
+
+# Writes a document made by create for each configuration's value in variants.  With several configurations, the
+# documents are collected as elements and merged before writing.
+def write_configurations(path, variants: Dict[str, Any], create: Callable[[Any, Any], None]):
+    writer = create_project()
+    if len(configurations) == 1:
+        create(writer, next(iter(variants.values())))
+        write_to_file(path, writer)
+        return
+    documents = {}
+    for condition, variant in variants.items():
+        builder = ProjectBuilder()
+        builder.start('Project')
+        create(builder, variant)
+        builder.end('Project')
+        documents[condition] = builder.close()
+    merged = xml.Element('Project')
+    merge_configurations(merged, documents, [configuration.condition for configuration in configurations])
+    for child in merged:
+        write_element(writer, child)
+    write_to_file(path, writer)
 
 
 # REVISIT this doesn't work too well for options that aren't overridden, like /TD.  vs19
 # for now we don't use this for compile settings and just always set all options per file, since we do that anyway for many many cases?
-def calculate_overrride_flags(objs, flags_names, process_text=None) -> (Dict, Dict):
+def calculate_overrride_flags(configuration: Configuration, objs, flags_names, process_text=None) -> (Dict, Dict):
     unique_counts = {
     }
 
@@ -332,9 +607,9 @@ def calculate_overrride_flags(objs, flags_names, process_text=None) -> (Dict, Di
         unique_counts[flags] = {}
 
     for obj in objs:
-        data: dict = cxx.get(obj)
+        data: dict = configuration.cxx.get(obj)
         if not data:
-            data = cc.get(obj)
+            data = configuration.cc.get(obj)
             if not data:
                 # must be resource
                 continue
@@ -345,7 +620,7 @@ def calculate_overrride_flags(objs, flags_names, process_text=None) -> (Dict, Di
             if not flags in data:
                 continue
             if process_text:
-                settings = process_text(data[flags], False)
+                settings = get_processed_setting(process_text, data[flags], False)
             else:
                 settings = data[flags]
             if settings in unique_counts[flags]:
@@ -360,14 +635,14 @@ def calculate_overrride_flags(objs, flags_names, process_text=None) -> (Dict, Di
         most_popular = sorted(unique_counts[flags], key=lambda record: unique_counts[flags][record], reverse=True)
         if len(most_popular) > 0:
             if process_text:
-                module_settings[flags] = process_text(most_popular[0], True)
+                module_settings[flags] = get_processed_setting(process_text, most_popular[0], True)
             else:
                 module_settings[flags] = most_popular[0]
             if options.verbose:
                 print(" ", flags, ":", module_settings[flags])
 
     for obj in objs:
-        data = cxx.get(obj) or cc.get(obj)
+        data = configuration.cxx.get(obj) or configuration.cc.get(obj)
         if not data:
             # must be resource
             continue
@@ -376,7 +651,7 @@ def calculate_overrride_flags(objs, flags_names, process_text=None) -> (Dict, Di
             if not flags in data:
                 continue
             if process_text:
-                settings = process_text(data[flags], False)
+                settings = get_processed_setting(process_text, data[flags], False)
             else:
                 settings = data[flags]
             if settings != module_settings[flags]:
@@ -386,13 +661,13 @@ def calculate_overrride_flags(objs, flags_names, process_text=None) -> (Dict, Di
     return module_settings, item_settings
 
 
-def calculate_item_settings(objs, flags_names, process_text=None) -> (Dict, List[str]):
+def calculate_item_settings(configuration: Configuration, objs, flags_names, process_text=None) -> (Dict, List[str]):
     obj_settings = {}
     opaque_objects = []
     for obj in objs:
-        data = cxx.get(obj)
+        data = configuration.cxx.get(obj)
         if not data:
-            data = cc.get(obj)
+            data = configuration.cc.get(obj)
             if not data:
                 # must be a resource, just link the obj and don't recompile it for now while we don't compile those
                 opaque_objects.append(obj)
@@ -405,7 +680,7 @@ def calculate_item_settings(objs, flags_names, process_text=None) -> (Dict, List
             if not flags in data:
                 continue
             if process_text:
-                obj_flags[flags] = process_text(data[flags], False)
+                obj_flags[flags] = get_processed_setting(process_text, data[flags], False)
             else:
                 obj_flags[flags] = data[flags]
         obj_settings[data['source']] = obj_flags
@@ -413,6 +688,15 @@ def calculate_item_settings(objs, flags_names, process_text=None) -> (Dict, List
     return obj_settings, opaque_objects
 
 
+def get_processed_setting(process_text: Callable[[str, bool], str], text: str, is_module: bool) -> str:
+    key = (process_text, text, is_module)
+    processed = processed_settings.get(key)
+    if processed is None:
+        processed = sys.intern(process_text(text, is_module))
+        processed_settings[key] = processed
+    return processed
+
+
 def process_include(text: str, is_module: bool):
     includes = text.split('/I')
     processed = []
@@ -465,69 +749,95 @@ def populate_intermediate_dirs(name):
         intermediates = intermediates.parent
 
 
-def write_project_references(path: pathlib.Path, module: ModuleInfo) -> List[str]:
-    doc = create_project()
-    project = doc.getroot()
+# Returns the (relative path, GUID, whether to link its library into ours) of each project the module references, or
+# None if it is a library that doesn't combine any shards, along with the libraries that aren't built by projects in
+# the solution.
+def find_project_references(path: pathlib.Path, module: ModuleInfo) -> (List[Tuple[str, str, bool]] | None, List[str]):
     # for some reason these are linked with ALL libraries in the build, regardless of dependencies
     if module.data['target'].endswith('.lib'):
-        write_to_file(path, doc)
-        return []
-    item_group = xml.SubElement(project, 'ItemGroup')
+        if not module.shards:
+            return None, []
+        # static libraries only include the libraries of references that ask for it
+        references = []
+        for shard in module.shards:
+            reference = find_project_reference(path, shard)
+            if reference is not None:
+                references.append(reference + (True,))
+        return references, []
+    references = []
     libraries = []
     if 'libs' in module.data:
         for lib in module.data['libs'].split(" "):
-            project_match = re.match(f' *(.*){options.build_flavor}.lib *', lib)
+            project_match = re.match(f' *(.*){module.build_flavor}.lib *', lib)
             if project_match:
                 project = project_match.group(1)
                 if project == module.name:
                     print(
                         f'ignoring module dependency from "{module.path}" on "{project}" (itself).  Apparently the build links this file to itself.')
                     continue
-                referenced_module_path = pathlib.Path(output_path / project)
-                referenced_project_file = referenced_module_path / 'Project.properties'
-                rel_path = os.path.relpath(f'{str(referenced_module_path / referenced_module_path.name)}.vcxproj',
-                                           str(path.parent.resolve()))
-                if referenced_project_file.exists():
-                    project_reference = xml.SubElement(item_group, 'ProjectReference', {'Include': rel_path})
-                    project_guid = xml.SubElement(project_reference, 'Project')
-                    project_xml = xml.parse(referenced_project_file).getroot()
-                    referenced_guid = project_xml.find(
-                        f'{{{PROJECT_NAMESPACE}}}PropertyGroup/{{{PROJECT_NAMESPACE}}}ProjectGuid')
-                    project_guid.text = f'{referenced_guid.text}'
-                else:
-                    if not options.dry_run:
-                        raise NotImplementedError(
-                            f'{project} not found at {str(referenced_project_file)} and references to projects not included in solution are not supported')
+                reference = find_project_reference(path, project)
+                if reference is not None:
+                    references.append(reference + (False,))
             else:
                 libraries.append(lib)
-    other_libraries = libraries
-    write_to_file(path, doc)
-    return other_libraries
+    return references, libraries
+
+
+def find_project_reference(path: pathlib.Path, project: str) -> Tuple[str, str] | None:
+    referenced_module_path = pathlib.Path(output_path / project)
+    referenced_project_file = referenced_module_path / 'Project.properties'
+    rel_path = os.path.relpath(f'{str(referenced_module_path / referenced_module_path.name)}.vcxproj',
+                               str(path.parent.resolve()))
+    if referenced_project_file.exists():
+        project_xml = xml.parse(referenced_project_file).getroot()
+        referenced_guid = project_xml.find(
+            f'{{{PROJECT_NAMESPACE}}}PropertyGroup/{{{PROJECT_NAMESPACE}}}ProjectGuid')
+        return rel_path, referenced_guid.text
+    if not options.dry_run:
+        raise NotImplementedError(
+            f'{project} not found at {str(referenced_project_file)} and references to projects not included in solution are not supported')
+    return None
 
 
-def build_module(name, module_data) -> ModuleInfo:
-    if options.verbose:
-        print(name)
+def create_project_references(writer, references: List[Tuple[str, str, bool]] | None):
+    if references is None:
+        return
+    writer.start('ItemGroup')
+    for rel_path, guid, link_library_dependencies in references:
+        writer.start('ProjectReference', {'Include': rel_path})
+        writer.element('Project', guid)
+        if link_library_dependencies:
+            writer.element('LinkLibraryDependencies', 'true')
+        writer.end('ProjectReference')
+    writer.end('ItemGroup')
+
+
+def create_module_directory(name):
+    path = pathlib.Path(output_path / name)
+    if not os.path.exists(path):
+        os.makedirs(path)
+    if not (path / 'Project.properties').exists():
+        write_project(path / 'Project.properties', name, path.name)
+    populate_intermediate_dirs(name)
 
-    module: ModuleInfo = ModuleInfo(pathlib.Path(output_path / name), name, module_data)
 
-    base_name = module.path.name
-    if not os.path.exists(module.path):
-        os.makedirs(module.path)
-    if not (module.path / 'Project.properties').exists():
-        write_project(module.path / 'Project.properties', name, module.path.name)
-    populate_intermediate_dirs(name)
+def build_module(configuration: Configuration, name, module_data) -> ModuleInfo:
+    if options.verbose:
+        print(f'{name} ({configuration.name})')
+
+    module: ModuleInfo = ModuleInfo(pathlib.Path(output_path / name), name, module_data, build_flavor=configuration.build_flavor)
+    create_module_directory(name)
 
     if 'libpath' in module_data:
         module.libpaths = process_libpath(module_data['libpath'], True)
 
     if 'sources' in module_data:
-        module.sources, module.other_items['Object'] = calculate_item_settings(module_data['sources'].split(" "),
+        module.sources, module.other_items['Object'] = calculate_item_settings(configuration, module_data['sources'].split(" "),
                                                                         ['cflags', 'ccflags', 'cxxflags', 'cppflags'],
                                                                         process_flags)
-        module.includes, module.src_includes = calculate_overrride_flags(module_data['sources'].split(" "), ['include'],
+        module.includes, module.src_includes = calculate_overrride_flags(configuration, module_data['sources'].split(" "), ['include'],
                                                                          process_include)
-        module.defines, module.src_defines = calculate_overrride_flags(module_data['sources'].split(" "), ['define'],
+        module.defines, module.src_defines = calculate_overrride_flags(configuration, module_data['sources'].split(" "), ['define'],
                                                                        process_define)
 
         # we build out of tree, so we need to explicitly allow local includes
@@ -542,18 +852,9 @@ def build_module(name, module_data) -> ModuleInfo:
         module.src_includes = {}
         module.src_defines = {}
 
-    write_module_settings(module.path / 'DebugOptions.properties', module, 'Debug|x64')
     return module
 
 
-def clean_build_report(input_path):
-    # reading through pipe directly into parser didn't work on Windows for unknown reason
-    os.system(
-        f'powershell -noprofile -Command "get-content \"{input_path}\" | Select-String -Pattern \'__BUILD_DATA_MAGIC_COOKIE__\' | %{{$_ -replace \\"__BUILD_DATA_MAGIC_COOKIE__\\",\\"\\"}}  > {options.build_path}_build_report.xml"')
-    tree = xml.parse(f'{options.build_path}_build_report.xml')
-    return tree.getroot()
-
-
 def write_solution():
     solution_path = f'{options.source_repo_path}godot_rebuild_{options.vs_version}.sln'
     if options.dry_run:
@@ -567,7 +868,7 @@ def write_solution():
     else:
         solution = open(solution_path, 'a+')
         solution.write('\n')
-        for path_str in list(ar.keys()) + list(link.keys()):
+        for path_str in modules.keys():
             path = pathlib.Path(path_str)
             project_xml = xml.parse(output_path / path / "Project.properties")
             guid = project_xml.getroot().find(f'{{{PROJECT_NAMESPACE}}}PropertyGroup/{{{PROJECT_NAMESPACE}}}ProjectGuid')
@@ -582,9 +883,16 @@ def write_solution():
         content = input.decode("utf-8-sig")
         solution.write(content)
 
-        for path_str in list(ar.keys()) + list(link.keys()):
-            solution.write(f'		{guids[path_str]}.Debug|x64.ActiveCfg = Debug|x64\n')
-            solution.write(f'		{guids[path_str]}.Debug|x64.Build.0 = Debug|x64\n')
+        for configuration in configurations:
+            solution.write(f'		{configuration.condition} = {configuration.condition}\n')
+        solution.write('	EndGlobalSection\n')
+        solution.write('	GlobalSection(ProjectConfigurationPlatforms) = postSolution\n')
+        for path_str, variants in modules.items():
+            for configuration in configurations:
+                solution.write(f'		{guids[path_str]}.{configuration.condition}.ActiveCfg = {configuration.condition}\n')
+                # projects for modules that this configuration doesn't build stay in the solution, but aren't built
+                if configuration.condition in variants:
+                    solution.write(f'		{guids[path_str]}.{configuration.condition}.Build.0 = {configuration.condition}\n')
 
         input = trailer.read()
         content = input.decode("utf-8-sig")
@@ -609,9 +917,8 @@ def resolve(reference: pathlib.Path, parent: xml.Element, location: int, child:
             for imported_child in list(imported):
                 imported.remove(imported_child)
                 parent.insert(new_location, imported_child)
-                # recurse into imported content with new relative path
-                resolve(import_path.parent, parent, new_location, imported_child)
-                new_location += 1
+                # recurse into imported content with new relative path; imports inside it insert more than one element
+                new_location = resolve(import_path.parent, parent, new_location, imported_child)
             return new_location
     inner_location: int = 0
     for grandchild in list(child):
@@ -625,7 +932,10 @@ def render(target_path: str, source_path: str):
     location: int = 0
     for child in list(project):
         location = resolve(reference, project, location, child)
-    write_to_file(target_path, doc)
+    writer = ProjectWriter(project.attrib)
+    for child in project:
+        write_element(writer, child)
+    write_to_file(target_path, writer)
 
 def write_flat_filters(path: str, module: ModuleInfo):
     SOURCE_FILES = 'Source Files'
@@ -640,83 +950,76 @@ def write_flat_filters(path: str, module: ModuleInfo):
         'Natvis': 'natvis'
     }
 
-    doc = create_project()
-    project = doc.getroot()
-    filter_item_group = xml.SubElement(project, 'ItemGroup')
+    writer = create_project()
     solution_root = pathlib.Path(os.path.relpath(options.source_repo_path, str(pathlib.Path(path).parent)))
 
-    write_filter_decl(filter_item_group, SOURCE_FILES, 'cpp;c;cc;cxx;c++;cppm;ixx;def;odl;idl;hpj;bat;asm;asmx')
-    item_group = xml.SubElement(project, 'ItemGroup')
+    writer.start('ItemGroup')
+    write_filter_decl(writer, SOURCE_FILES, 'cpp;c;cc;cxx;c++;cppm;ixx;def;odl;idl;hpj;bat;asm;asmx')
+    for item_type in module.other_items.keys():
+        write_filter_decl(writer, OTHER_FILES.get(item_type, item_type), OTHER_EXTENSIONS.get(item_type, ''))
+    writer.end('ItemGroup')
+
+    writer.start('ItemGroup')
     for compile_path in module.sources.keys():
-        clcompile = xml.SubElement(item_group, 'ClCompile')
-        clcompile.set('Include', str(solution_root / compile_path))
-        filter = xml.SubElement(clcompile, 'Filter')
-        filter.text = SOURCE_FILES
+        writer.start('ClCompile', {'Include': str(solution_root / compile_path)})
+        writer.element('Filter', SOURCE_FILES)
+        writer.end('ClCompile')
+    writer.end('ItemGroup')
 
-    if module.other_items and len(module.other_items) > 0:
-        for item_type in module.other_items.keys():
-            title = OTHER_FILES.pop(item_type, item_type)
-            write_filter_decl(filter_item_group, title, OTHER_EXTENSIONS.pop(item_type, ''))
-            item_group = xml.SubElement(project, 'ItemGroup')
-            for item_path in module.other_items[item_type]:
-                object = xml.SubElement(item_group, item_type)
-                object.set('Include', str(solution_root / item_path))
-                filter = xml.SubElement(object, 'Filter')
-                filter.text = title
+    for item_type in module.other_items.keys():
+        title = OTHER_FILES.get(item_type, item_type)
+        writer.start('ItemGroup')
+        for item_path in module.other_items[item_type]:
+            writer.start(item_type, {'Include': str(solution_root / item_path)})
+            writer.element('Filter', title)
+            writer.end(item_type)
+        writer.end('ItemGroup')
 
-    write_to_file(path, doc)
+    write_to_file(path, writer)
 
 
 def write_file_system_filters(path: str, module: ModuleInfo):
-    doc = create_project()
-    project = doc.getroot()
-    filter_item_group = xml.SubElement(project, 'ItemGroup')
+    writer = create_project()
     solution_root = pathlib.Path(os.path.relpath(options.source_repo_path, str(pathlib.Path(path).parent)))
 
+    # the filters are declared before the items that use them, so they are all found first
     filters = {}
-
-    item_group = xml.SubElement(project, 'ItemGroup')
-    for compile_path in module.sources.keys():
-        clcompile = xml.SubElement(item_group, 'ClCompile')
-        clcompile.set('Include', str(solution_root / compile_path))
-        filter_path = pathlib.Path(compile_path).parent
-        walk = filter_path
-        while len(walk.parts) > 0:
-            if walk in filters:
-                break
-            filters[walk] = walk
-            write_filter_decl(filter_item_group, str(walk), '')
-            walk = walk.parent
-        filter = xml.SubElement(clcompile, 'Filter')
-        filter.text = str(filter_path)
-
-    if module.other_items and len(module.other_items) > 0:
-        for item_type in module.other_items.keys():
-            item_group = xml.SubElement(project, 'ItemGroup')
-            for item_path in module.other_items[item_type]:
-                item_element = xml.SubElement(item_group, item_type)
-                item_element.set('Include', str(solution_root / item_path))
-                filter_path = pathlib.Path(item_path).parent
-                walk = filter_path
-                while len(walk.parts) > 0:
-                    if walk in filters:
-                        break
-                    filters[walk] = walk
-                    write_filter_decl(filter_item_group, str(walk), '')
-                    walk = walk.parent
-                filter = xml.SubElement(item_element, 'Filter')
-                filter.text = str(filter_path)
-
-    write_filter_decl(filter_item_group, 'Lost and Found', 'cpp;c;cc;cxx;c++;cppm;ixx;def;odl;idl;hpj;bat;asm;asmx;h;hh;hpp;hxx;h++;hm;inl;inc;ipp;xsd')
-    write_to_file(path, doc)
-
-
-def write_filter_decl(item_group, filter_name, extensions_text):
-    filter = xml.SubElement(item_group, 'Filter', {'Include': filter_name})
-    unique_identifier = xml.SubElement(filter, 'UniqueIdentifer')
-    unique_identifier.text = f'{{{str(uuid.uuid4()).upper()}}}'
-    extensions = xml.SubElement(filter, 'Extensions')
-    extensions.text = extensions_text
+    items = []
+    for item_type, item_paths in [('ClCompile', module.sources.keys())] + list(module.other_items.items()):
+        filtered_items = []
+        for item_path in item_paths:
+            filter_path = pathlib.Path(item_path).parent
+            walk = filter_path
+            while len(walk.parts) > 0:
+                if walk in filters:
+                    break
+                filters[walk] = walk
+                walk = walk.parent
+            filtered_items.append((str(solution_root / item_path), str(filter_path)))
+        items.append((item_type, filtered_items))
+
+    writer.start('ItemGroup')
+    for filter_path in filters.keys():
+        write_filter_decl(writer, str(filter_path), '')
+    write_filter_decl(writer, 'Lost and Found', 'cpp;c;cc;cxx;c++;cppm;ixx;def;odl;idl;hpj;bat;asm;asmx;h;hh;hpp;hxx;h++;hm;inl;inc;ipp;xsd')
+    writer.end('ItemGroup')
+
+    for item_type, filtered_items in items:
+        writer.start('ItemGroup')
+        for include, filter_path in filtered_items:
+            writer.start(item_type, {'Include': include})
+            writer.element('Filter', filter_path)
+            writer.end(item_type)
+        writer.end('ItemGroup')
+
+    write_to_file(path, writer)
+
+
+def write_filter_decl(writer, filter_name, extensions_text):
+    writer.start('Filter', {'Include': filter_name})
+    writer.element('UniqueIdentifer', f'{{{str(uuid.uuid5(options.filter_guid_namespace, filter_name)).upper()}}}')
+    writer.element('Extensions', extensions_text)
+    writer.end('Filter')
 
 # XXX this is gross, we should know this from template tree somehow? put markers in the template XML?
 def is_module_path(module_name) -> bool:
@@ -726,48 +1029,381 @@ def is_module_path(module_name) -> bool:
         return True
     return False
 
-def main():
-    if not options.dirty:
-        recreate_build_tree()
+# start and end times are only present if the build ran with the current scons_xml.patch
+def get_duration(data: Dict[str, Any]) -> float:
+    if 'start' not in data or 'end' not in data:
+        return 0.0
+    return max(0.0, float(data['end']) - float(data['start']))
+
+
+def get_compiled_objects(configuration: Configuration, module_data) -> List[str]:
+    if 'sources' not in module_data:
+        return []
+    return [obj for obj in module_data['sources'].split(" ") if obj in configuration.cxx or obj in configuration.cc]
+
+
+def get_library_dependencies(configuration: Configuration, name, module_data) -> List[str]:
+    dependencies = []
+    if 'libs' in module_data:
+        for lib in module_data['libs'].split(" "):
+            project_match = re.match(f' *(.*){configuration.build_flavor}.lib *', lib)
+            if project_match and project_match.group(1) in configuration.ar and project_match.group(1) != name:
+                dependencies.append(project_match.group(1))
+    return dependencies
+
+
+# longest chain of compile, archive and link steps that ends in this module, assuming unlimited parallelism
+def calculate_critical_path(configuration: Configuration, name, critical_paths) -> (float, List[Tuple[float, str]]):
+    if name in critical_paths:
+        return critical_paths[name]
+    module_data = configuration.ar.get(name) or configuration.link.get(name)
+    longest = (0.0, [])
+    for obj in get_compiled_objects(configuration, module_data):
+        data = configuration.cxx.get(obj) or configuration.cc.get(obj)
+        duration = get_duration(data)
+        if duration > longest[0]:
+            longest = (duration, [(duration, f'compile {data["source"]}')])
+    for dependency in get_library_dependencies(configuration, name, module_data):
+        candidate = calculate_critical_path(configuration, dependency, critical_paths)
+        if candidate[0] > longest[0]:
+            longest = candidate
+    duration = get_duration(module_data)
+    step = 'link' if name in configuration.link else 'archive'
+    critical_paths[name] = (longest[0] + duration, longest[1] + [(duration, f'{step} {name}')])
+    return critical_paths[name]
+
+
+def write_timing_report(configuration: Configuration, path: str):
+    compile_times = []
+    module_times = {}
+    for name, module_data in list(configuration.ar.items()) + list(configuration.link.items()):
+        total = 0.0
+        objs = get_compiled_objects(configuration, module_data)
+        for obj in objs:
+            data = configuration.cxx.get(obj) or configuration.cc.get(obj)
+            duration = get_duration(data)
+            total += duration
+            compile_times.append((duration, data['source'], name))
+        module_times[name] = (total, len(objs), get_duration(module_data))
+
+    if not any(duration > 0.0 for duration, _, _ in compile_times):
+        print(f'build report {configuration.report_path} has no timing data, apply the current scons_xml.patch and rebuild')
+        return
+
+    lines = [f'Build timing report for {configuration.report_path}', '']
+    lines.append(f'Slowest translation units (of {len(compile_times)}):')
+    compile_times.sort(reverse=True)
+    for duration, source, name in compile_times[:TIMING_REPORT_LENGTH]:
+        lines.append(f'{duration:10.3f}s  {source}  ({name})')
+
+    lines.append('')
+    lines.append('Per-module totals (compile, translation units, archive or link):')
+    for name, (total, count, own) in sorted(module_times.items(), key=lambda item: item[1][0], reverse=True):
+        lines.append(f'{total:10.3f}s  {count:6}  {own:8.3f}s  {name}')
+
+    critical_paths = {}
+    for name, module_data in configuration.link.items():
+        length, steps = calculate_critical_path(configuration, name, critical_paths)
+        lines.append('')
+        lines.append(f'Link critical path for {module_data["target"]}: {length:.3f}s')
+        for duration, step in steps:
+            lines.append(f'{duration:10.3f}s  {step}')
 
-    for child in clean_build_report(options.build_report_path):
+    if options.dry_run:
+        print('\n'.join(lines))
+        return
+    with open(path, 'w') as report:
+        report.write('\n'.join(lines))
+        report.write('\n')
+
+
+# total compile time and number of compiled objects of each module
+def get_compile_times(configuration: Configuration) -> Dict[str, Tuple[float, int]]:
+    compile_times = {}
+    for name, module_data in list(configuration.ar.items()) + list(configuration.link.items()):
+        objs = get_compiled_objects(configuration, module_data)
+        compile_times[name] = (sum(get_duration(configuration.cxx.get(obj) or configuration.cc.get(obj)) for obj in objs), len(objs))
+    return compile_times
+
+
+# gives the most expensive module the whole budget and every other module a share proportional to its compile time
+def balance_processors(configuration: Configuration, compile_times: Dict[str, Tuple[float, int]], budget: int) -> Dict[str, int]:
+    most = max((total for total, _ in compile_times.values()), default=0.0)
+    if most <= 0.0:
+        print(f'build report {configuration.report_path} has no timing data, not balancing processors')
+        return {}
+
+    balanced = {}
+    for name, (total, count) in compile_times.items():
+        if count < 1:
+            continue
+        balanced[name] = max(1, min(budget, count, math.ceil(budget * total / most)))
+        if options.verbose:
+            print(f'{name}: {balanced[name]} processors for {total:.3f}s of compilation')
+    return balanced
+
+
+# Shares the processors between the projects by their compile times in this configuration.  A module split into shards
+# is balanced as its shards, because they build in parallel.
+def assign_processors(configuration: Configuration, budget: int):
+    compile_times = get_compile_times(configuration)
+    for name, variants in modules.items():
+        module = variants.get(configuration.condition)
+        if module is None or not module.shards:
+            continue
+        durations = {}
+        for obj in get_compiled_objects(configuration, module.data):
+            data = configuration.cxx.get(obj) or configuration.cc.get(obj)
+            durations[data['source']] = get_duration(data)
+        compile_times.pop(name, None)
+        for shard_name in module.shards:
+            shard = modules[shard_name][configuration.condition]
+            compile_times[shard_name] = (sum(durations.get(compile_path, 0.0) for compile_path in shard.sources), len(shard.sources))
+
+    processor_numbers = balance_processors(configuration, compile_times, budget)
+    for name, variants in modules.items():
+        for module in variants.values():
+            module.processor_number = processor_numbers.get(name, 0)
+
+
+# Reads, indexes and decodes one build report in a single pass, so only the decoded configuration is held in memory,
+# not the raw records.  With several reports this runs in a worker process per report, so only the decoded
+# configuration goes back to the main process, with each distinct string in it pickled once.
+def read_configuration(report_path: str, write_index: bool) -> Configuration:
+    index = {} if write_index and not is_index_current(report_path) else None
+    configuration = load_configuration(report_path, read_records_for_configuration(report_path, index))
+    if index is not None:
+        write_build_report_index(report_path, index)
+    return configuration
+
+
+# the tag and fields of each record, adding the record to index on the way unless it is None
+def read_records_for_configuration(report_path: str, index: Dict[str, List[Tuple[int, int]]] | None
+                                   ) -> Iterator[Tuple[str, Dict[bytes, bytes]]]:
+    for offset, length, tag, raw_fields in read_build_records(report_path):
+        if index is not None:
+            index_build_record(index, offset, length, tag, raw_fields)
+        yield tag, raw_fields
+
+
+def get_decoded_field(raw: bytes) -> str:
+    text = decoded_fields.get(raw)
+    if text is None:
+        text = decode_build_field(raw)
+        if '&' in text:
+            text = unescape(text, XML_ENTITIES)
+        text = sys.intern(text)
+        decoded_fields[raw] = text
+    return text
+
+
+def load_configuration(report_path: str, records: Iterable[Tuple[str, Dict[bytes, bytes]]]) -> Configuration:
+    configuration = Configuration(report_path)
+    for tag, raw_fields in records:
         data = {}
-        for element in child:
-            if element.text:
-                # remove SCons magic parentheses
-                data[element.tag] = re.sub(r' +\$\)($| +)|(^| +)\$\( +', ' ', element.text)
-        match child.tag:
+        for name, raw in raw_fields.items():
+            if raw:
+                data[get_decoded_field(name)] = get_decoded_field(raw)
+        match tag:
             case "cc":
-                cc[child.find("target").text] = data
-                pass
+                configuration.cc[data['target']] = data
             case "cxx":
-                cxx[child.find("target").text] = data
-                pass
+                configuration.cxx[data['target']] = data
             case "ar":
                 data.pop('libpath', None)
                 data.pop('linkflags', None)
                 data.pop('libs', None)
-                ar[get_project_basename(child)] = data
+                configuration.ar[get_target_basename(data['target'])] = data
             case "link":
-                link[get_project_basename(child)] = data
+                configuration.link[get_target_basename(data['target'])] = data
             case _:
-                raise NotImplementedError(f'unsupported build report tag {child.tag}')
+                raise NotImplementedError(f'unsupported build report tag {tag}')
+    return configuration
+
+
+# the decoration SCons put on the object files, e.g. ".windows.tools.x86_64"
+def detect_build_flavor(configuration: Configuration) -> str:
+    for target in list(configuration.cxx.keys()) + list(configuration.cc.keys()):
+        flavor_match = re.search(r'(\.windows\.[^\\/]*)\.obj$', target)
+        if flavor_match:
+            return flavor_match.group(1)
+    raise NotImplementedError(f'no build flavor found in {configuration.report_path}, use --build-flavor')
+
+
+# Names a configuration after its build flavor.  Names derived from other build flavors stay clear of the names for
+# the known ones, and a number is added to a name that is already used.
+def get_configuration_name(build_flavor: str, used_names: List[str]) -> str:
+    if build_flavor in FLAVOR_CONFIGURATIONS:
+        name = FLAVOR_CONFIGURATIONS[build_flavor]
+        taken = set(used_names)
+    else:
+        name = ''.join(part.capitalize() for part in build_flavor.split('.') if part not in ['', 'windows', 'x86_64'])
+        if not name:
+            raise NotImplementedError(f'no configuration name in build flavor {build_flavor}, use --configuration')
+        taken = set(used_names) | set(FLAVOR_CONFIGURATIONS.values())
+    unique = name
+    number = 2
+    while unique in taken:
+        unique = f'{name}{number}'
+        number += 1
+    return unique
+
+
+def load_configurations() -> List[Configuration]:
+    report_paths = options.build_report_path
+    build_flavors = options.build_flavor or []
+    names = options.configuration or []
+    if len(build_flavors) > len(report_paths) or len(names) > len(report_paths):
+        command_line.error('there can only be one --build-flavor and one --configuration for each build report')
+
+    # reports are parsed and decoded in parallel, each worker with its own decoded_fields, and the settings processed
+    # from them afterwards are shared between the configurations in processed_settings
+    write_index = not options.dry_run
+    workers = min(len(report_paths), os.cpu_count() or 1)
+    if workers > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            read = list(executor.map(read_configuration, report_paths, [write_index] * len(report_paths)))
+    else:
+        read = [read_configuration(report_path, write_index) for report_path in report_paths]
+
+    loaded = []
+    for index, (report_path, configuration) in enumerate(zip(report_paths, read)):
+        configuration.build_flavor = build_flavors[index] if index < len(build_flavors) else detect_build_flavor(configuration)
+        if index < len(names):
+            configuration.name = names[index]
+            if any(other.name == configuration.name for other in loaded):
+                command_line.error(f'configuration {configuration.name} for {report_path} is already used')
+        else:
+            configuration.name = get_configuration_name(configuration.build_flavor, [other.name for other in loaded])
+        if options.verbose:
+            print(f'{report_path}: {configuration.condition} with build flavor {configuration.build_flavor}')
+        loaded.append(configuration)
+    return loaded
+
+
+# the configurations for every project, and the decoration each configuration puts on binaries
+def write_project_configurations(path):
+    writer = create_project()
+    writer.start('ItemGroup', {'Label': 'ProjectConfigurations'})
+    for configuration in configurations:
+        writer.start('ProjectConfiguration', {'Include': configuration.condition})
+        writer.element('Configuration', configuration.name)
+        writer.element('Platform', PLATFORM)
+        writer.end('ProjectConfiguration')
+    writer.end('ItemGroup')
+    for configuration in configurations:
+        writer.start('PropertyGroup', {'Condition': get_condition_expression([configuration.condition])})
+        writer.element('BuildFlavor', configuration.build_flavor)
+        writer.end('PropertyGroup')
+    write_to_file(path, writer)
+
+
+# Everything that all generated files depend on besides the build reports: this script, the templates it copies and
+# the Python version, which decides how ElementTree serializes.
+def get_generator_digest() -> bytes:
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f'{sys.version_info.major}.{sys.version_info.minor}'.encode())
+    with open(__file__, 'rb') as script:
+        digest.update(script.read())
+    template_root = pathlib.Path(f'templates/{options.vs_version}')
+    for template in sorted(template_root.glob('**/*')):
+        if template.is_file():
+            digest.update(template.relative_to(template_root).as_posix().encode())
+            digest.update(template.read_bytes())
+    return digest.digest()
+
+
+# Hash of everything the files generated for a module depend on, so that identical modules in different checkouts
+# share them through the fragment store.  Returns None if there is no fragment store.
+def get_module_key(generator_digest: bytes, name: str, module_path: pathlib.Path, variants: Dict[str, ModuleInfo],
+                   references: Dict[str, List[Tuple[str, str, bool]] | None]) -> bytes | None:
+    if not options.fragment_store or options.dry_run:
+        return None
+    digest = hashlib.blake2b(generator_digest, digest_size=16)
+    digest.update(repr((name, os.path.relpath(options.source_repo_path, str(module_path)), settings_processing,
+                        options.flat_filters, [(configuration.condition, configuration.build_flavor) for configuration in configurations])).encode())
+    for condition, module in variants.items():
+        data = {key: value for key, value in module.data.items() if key not in TIMING_FIELDS}
+        digest.update(repr((condition, module.build_flavor, data, module.sources, module.src_defines, module.src_includes,
+                            module.includes, module.defines, module.compile_settings, module.lib_settings, module.libpaths,
+                            module.other_items, module.other_libraries, module.processor_number, references[condition])).encode())
+    return digest.digest()
+
+
+def get_fragment_path(module_key: bytes, file_name: str) -> pathlib.Path:
+    key = hashlib.blake2b(module_key + file_name.encode(), digest_size=16).hexdigest()
+    return pathlib.Path(options.fragment_store) / key[:2] / key
+
+
+# Generates the file at path with write, unless the fragment store already has it for the same inputs.  Stored files
+# are hard linked, except the ones edited in the IDE, which are copied: saving a hard link in place would change the
+# stored file, and with it every checkout linked to it.
+def write_fragment(path: str, module_key: bytes | None, write: Callable[[str], None], editable: bool = False):
+    if module_key is None:
+        write(path)
+        return
+    stored_path = get_fragment_path(module_key, pathlib.Path(path).name)
+    if stored_path.exists():
+        if options.verbose:
+            print(f'{path} from fragment store')
+        if editable:
+            copy_file(stored_path, path)
+        else:
+            link_or_copy(stored_path, path)
+        return
+    write(path)
+    # other generators may be storing the same fragment at the same time, so it only appears once it is complete
+    os.makedirs(stored_path.parent, exist_ok=True)
+    temporary_path = stored_path.with_name(f'{stored_path.name}.{os.getpid()}.tmp')
+    shutil.copyfile(path, temporary_path)
+    os.replace(temporary_path, stored_path)
 
-    # XXX merge modules
 
-    for name, module_data in ar.items():
-        module = build_module(name, module_data)
-        modules[name] = module
-        template_path = f'templates/{options.vs_version}/static_library/_static_library_.vcxproj'
-        if not options.dry_run:
-            shutil.copy(template_path, module.path / f'{module.path.name}_open.vcxproj')
+# the target may be a hard link from an earlier run, which copying over it would write through
+def copy_file(source_path, target_path):
+    if os.path.lexists(target_path):
+        os.remove(target_path)
+    shutil.copyfile(source_path, target_path)
 
-    for name, module_data in link.items():
-        module = build_module(name, module_data)
-        modules[name] = module
-        if module.data['target'].endswith(".exe") and not options.dry_run:
-            shutil.copy(f'templates/{options.vs_version}/executable/_executable_.vcxproj',
-                        module.path / f'{module.path.name}_open.vcxproj')
+
+# hard links only work within one volume, otherwise the file is copied
+def link_or_copy(source_path, target_path):
+    if os.path.lexists(target_path):
+        os.remove(target_path)
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copyfile(source_path, target_path)
+
+
+def main():
+    if not options.dirty:
+        recreate_build_tree()
+
+    configurations.extend(load_configurations())
+
+    if options.timing_report:
+        write_timing_report(configurations[0], options.timing_report)
+
+    write_project_configurations(output_path / 'ProjectConfigurations.properties')
+
+    # XXX merge modules
+
+    for configuration in configurations:
+        for name, module_data in configuration.ar.items():
+            module = build_module(configuration, name, module_data)
+            if name not in modules and not options.dry_run:
+                template_path = f'templates/{options.vs_version}/static_library/_static_library_.vcxproj'
+                shutil.copy(template_path, module.path / f'{module.path.name}_open.vcxproj')
+            modules.setdefault(name, {})[configuration.condition] = module
+
+    for configuration in configurations:
+        for name, module_data in configuration.link.items():
+            module = build_module(configuration, name, module_data)
+            if name not in modules and module.data['target'].endswith(".exe") and not options.dry_run:
+                shutil.copy(f'templates/{options.vs_version}/executable/_executable_.vcxproj',
+                            module.path / f'{module.path.name}_open.vcxproj')
+            modules.setdefault(name, {})[configuration.condition] = module
 
     # second pass: sort other files not explicitly mentioned in log to modules
     module_list: list = list(modules.keys())
@@ -779,7 +1415,7 @@ def main():
     # remember mapping to modules, because we are now putting them in a different order
     module_prefix_index = {}
     for index in range(0, len(prefix_list)):
-        module_prefix_index[prefix_list[index]] = modules[module_list[index]]
+        module_prefix_index[prefix_list[index]] = next(iter(modules[module_list[index]].values()))
 
     # sort for binary searches below
     prefix_list.sort()
@@ -787,23 +1423,232 @@ def main():
     assign_other_files(module_prefix_index, prefix_list, 'CLInclude', 'h')
     assign_other_files(module_prefix_index, prefix_list, 'Natvis', 'natvis')
 
-    # third pass: write sources, resolve dependencies, write solution, write filters
-    for name, module in modules.items():
-        write_sources(module.path / 'DebugSources.properties', module, 'Debug|x64')
+    # headers don't depend on the configuration, so every configuration shares the ones found for the first
+    for variants in modules.values():
+        assigned = next(iter(variants.values()))
+        for module in variants.values():
+            for item_type in ['CLInclude', 'Natvis']:
+                if item_type in assigned.other_items:
+                    module.other_items[item_type] = assigned.other_items[item_type]
+
+    if options.shard_sources > 0 or options.shard_bytes > 0:
+        shard_modules()
+
+    if options.balance_processors > 0:
+        assign_processors(configurations[0], options.balance_processors)
+
+    generator_digest = get_generator_digest() if options.fragment_store else b''
+
+    # third pass: resolve dependencies, write settings and sources, write solution, write filters
+    for name, variants in modules.items():
         module_path = pathlib.Path(output_path / name)
-        module.other_libraries = write_project_references(module_path / 'ProjectReferences.properties', module)
-        write_module_libraries(module_path / 'DebugLibraries.properties', module, 'Debug|x64')
+        references = {}
+        for condition, module in variants.items():
+            references[condition], module.other_libraries = find_project_references(module_path / 'ProjectReferences.properties', module)
+        write_configurations(module_path / 'ProjectReferences.properties', references, create_project_references)
+        module_key = get_module_key(generator_digest, name, module_path, variants, references)
+        write_fragment(str(module_path / 'Options.properties'), module_key,
+                       lambda path: write_configurations(path, variants, create_module_settings))
+        write_fragment(str(module_path / 'Sources.properties'), module_key, lambda path: write_configurations(
+            path, variants, lambda writer, module: create_sources(writer, path, module)))
+        write_fragment(str(module_path / 'Libraries.properties'), module_key,
+                       lambda path: write_configurations(path, variants, create_module_libraries))
         base_path = str(module_path / module_path.name)
-        if options.flat_filters:
-            write_flat_filters(f'{base_path}_open.vcxproj.filters', module)
-        else:
-            write_file_system_filters(f'{base_path}_open.vcxproj.filters', module)
+        write_filters = write_flat_filters if options.flat_filters else write_file_system_filters
+        write_fragment(f'{base_path}_open.vcxproj.filters', module_key,
+                       lambda path: write_filters(path, get_filtered_module(list(variants.values()))), editable=True)
         if options.closed:
-            render(f'{base_path}.vcxproj', f'{base_path}_open.vcxproj')
-            shutil.copy(f'{base_path}_open.vcxproj.filters', f'{base_path}.vcxproj.filters')
+            write_fragment(f'{base_path}.vcxproj', module_key, lambda path: render(path, f'{base_path}_open.vcxproj'),
+                           editable=True)
+            if not options.dry_run:
+                copy_file(f'{base_path}_open.vcxproj.filters', f'{base_path}.vcxproj.filters')
     write_solution()
 
 
+# filters can't depend on the configuration, so they show the files of all configurations
+def get_filtered_module(variants: List[ModuleInfo]) -> ModuleInfo:
+    if len(variants) == 1:
+        return variants[0]
+    filtered = ModuleInfo(variants[0].path, variants[0].name, variants[0].data)
+    for module in variants:
+        for compile_path in module.sources.keys():
+            filtered.sources.setdefault(compile_path, {})
+        for item_type, item_paths in module.other_items.items():
+            filtered_paths = filtered.other_items.setdefault(item_type, [])
+            known = set(filtered_paths)
+            filtered_paths.extend(item_path for item_path in item_paths if item_path not in known)
+    return filtered
+
+
+# how much heavier than average the heaviest shard may be before its folders are split further
+SHARD_BALANCE_TOLERANCE = 1.1
+
+
+# Part of a static library's sources that goes into one shard: either a directory's whole subtree, or just the files
+# directly in it, if its subdirectories had to be placed separately.
+@dataclass
+class ShardUnit:
+    directory: pathlib.Path
+    subtree: bool
+    weight: int
+
+
+def get_source_size(compile_path: str) -> int:
+    try:
+        return os.path.getsize(os.path.join(options.source_repo_path, compile_path))
+    except OSError:
+        return 0
+
+
+def get_shard_count(weights: Dict[str, int], sizes: Dict[str, int]) -> int:
+    count = 1
+    if options.shard_sources > 0:
+        count = max(count, math.ceil(len(weights) / options.shard_sources))
+    if options.shard_bytes > 0:
+        count = max(count, math.ceil(sum(sizes.values()) / options.shard_bytes))
+    return count
+
+
+# Splits the sources along the same directory hierarchy as the file system filters, so every shard shows whole folders.
+# Starting from the whole tree, the largest subtree is broken up into its own files and its subdirectories until the
+# pieces can be balanced.  The files directly in one directory are never split.
+def partition_sources(weights: Dict[str, int], shard_count: int) -> List[List[ShardUnit]]:
+    own_weights: Dict[pathlib.Path, int] = {}
+    # dictionaries as ordered sets, so the result doesn't depend on hash seeds
+    children: Dict[pathlib.Path, Dict[pathlib.Path, None]] = {}
+    for compile_path, weight in weights.items():
+        directory = pathlib.Path(compile_path).parent
+        own_weights[directory] = own_weights.get(directory, 0) + weight
+        while len(directory.parts) > 0:
+            siblings = children.setdefault(directory.parent, {})
+            if directory in siblings:
+                break
+            siblings[directory] = None
+            directory = directory.parent
+
+    subtree_weights: Dict[pathlib.Path, int] = {}
+
+    def get_subtree_weight(directory: pathlib.Path) -> int:
+        weight = own_weights.get(directory, 0) + sum(get_subtree_weight(child) for child in children.get(directory, {}))
+        subtree_weights[directory] = weight
+        return weight
+
+    root = pathlib.Path()
+    units = [ShardUnit(root, True, get_subtree_weight(root))]
+    target = units[0].weight / shard_count
+    while True:
+        shards, loads = assign_shard_units(units, shard_count)
+        if max(loads) <= target * SHARD_BALANCE_TOLERANCE:
+            break
+        splittable = [unit for unit in units if unit.subtree and unit.directory in children]
+        if len(splittable) == 0:
+            break
+        largest = max(splittable, key=lambda unit: unit.weight)
+        units.remove(largest)
+        if largest.directory in own_weights:
+            units.append(ShardUnit(largest.directory, False, own_weights[largest.directory]))
+        units.extend(ShardUnit(child, True, subtree_weights[child]) for child in children[largest.directory])
+
+    shards = [shard for shard in shards if len(shard) > 0]
+    shards.sort(key=lambda shard: min(str(unit.directory) for unit in shard))
+    return shards
+
+
+# places the units largest first into the lightest shard
+def assign_shard_units(units: List[ShardUnit], shard_count: int) -> (List[List[ShardUnit]], List[int]):
+    shards: List[List[ShardUnit]] = [[] for _ in range(shard_count)]
+    loads = [0] * shard_count
+    for unit in sorted(units, key=lambda unit: (-unit.weight, str(unit.directory), unit.subtree)):
+        index = loads.index(min(loads))
+        shards[index].append(unit)
+        loads[index] += unit.weight
+    return shards, loads
+
+
+# index of the shard that holds files in this directory, or None if none of them do
+def find_shard(directory: pathlib.Path, files: Dict[pathlib.Path, int], subtrees: Dict[pathlib.Path, int]) -> int | None:
+    if directory in files:
+        return files[directory]
+    while True:
+        if directory in subtrees:
+            return subtrees[directory]
+        if len(directory.parts) == 0:
+            return None
+        directory = directory.parent
+
+
+# Replaces static libraries over the --shard-sources or --shard-bytes budget by several projects that each build a
+# part of the sources.  The original project keeps its name and output, and combines the shards' libraries into it.
+def shard_modules():
+    sharded: Dict[str, Dict[str, ModuleInfo]] = {}
+    for name, variants in modules.items():
+        sharded[name] = variants
+        if not next(iter(variants.values())).data['target'].endswith('.lib'):
+            continue
+        compile_paths = list(get_filtered_module(list(variants.values())).sources.keys())
+        sizes = {compile_path: get_source_size(compile_path) for compile_path in compile_paths} if options.shard_bytes > 0 else {}
+        shard_count = get_shard_count(dict.fromkeys(compile_paths, 1), sizes)
+        if shard_count < 2:
+            continue
+        # without the sources on disk, sizes are all zero and can't balance anything
+        weights = sizes if sum(sizes.values()) > 0 else dict.fromkeys(compile_paths, 1)
+        shard_units = partition_sources(weights, shard_count)
+        if len(shard_units) < 2:
+            continue
+
+        files: Dict[pathlib.Path, int] = {}
+        subtrees: Dict[pathlib.Path, int] = {}
+        for index, units in enumerate(shard_units):
+            for unit in units:
+                (subtrees if unit.subtree else files)[unit.directory] = index
+        shard_names = [f'{name}_shard{index + 1}' for index in range(len(shard_units))]
+        for shard_name in shard_names:
+            create_module_directory(shard_name)
+            shard_path = pathlib.Path(output_path / shard_name)
+            if not options.dry_run:
+                shutil.copy(f'templates/{options.vs_version}/static_library/_static_library_.vcxproj',
+                            shard_path / f'{shard_path.name}_open.vcxproj')
+        if options.verbose:
+            print(f'{name} split into {len(shard_names)} projects')
+
+        for condition, module in variants.items():
+            shards = [ModuleInfo(pathlib.Path(output_path / shard_name), shard_name, module.data,
+                                 includes=module.includes, libpaths=module.libpaths, defines=module.defines,
+                                 compile_settings=module.compile_settings, lib_settings=module.lib_settings,
+                                 build_flavor=module.build_flavor)
+                      for shard_name in shard_names]
+            for compile_path, override_flags in module.sources.items():
+                shard = shards[find_shard(pathlib.Path(compile_path).parent, files, subtrees)]
+                shard.sources[compile_path] = override_flags
+                if compile_path in module.src_includes:
+                    shard.src_includes[compile_path] = module.src_includes[compile_path]
+                if compile_path in module.src_defines:
+                    shard.src_defines[compile_path] = module.src_defines[compile_path]
+
+            # headers go with the sources next to them, and the rest stay with the combined library
+            for item_type in ['CLInclude', 'Natvis']:
+                if item_type not in module.other_items:
+                    continue
+                remaining = []
+                for item_path in module.other_items[item_type]:
+                    index = find_shard(pathlib.Path(item_path).parent, files, subtrees)
+                    if index is None:
+                        remaining.append(item_path)
+                    else:
+                        shards[index].other_items.setdefault(item_type, []).append(item_path)
+                module.other_items[item_type] = remaining
+
+            module.sources = {}
+            module.src_includes = {}
+            module.src_defines = {}
+            module.shards = shard_names
+            for shard_name, shard in zip(shard_names, shards):
+                sharded.setdefault(shard_name, {})[condition] = shard
+
+    modules.clear()
+    modules.update(sharded)
+
+
 def assign_other_files(module_prefix_index, prefix_list, item_type, extension):
     for long_path in pathlib.Path(options.source_repo_path).glob('**/*.%s' % extension):
         path = long_path.relative_to(options.source_repo_path)
@@ -847,8 +1692,327 @@ def assign_other_files(module_prefix_index, prefix_list, item_type, extension):
         module_prefix_index[module_index].other_items[item_type].append(path_str)
 
 
-def get_project_basename(child):
-    return child.find("target").text.split(".windows.")[0]
+def get_target_basename(target: str) -> str:
+    return target.split(".windows.")[0]
+
+
+def remove_scons_magic(text: str) -> str:
+    if '$' not in text:
+        return text
+    # remove SCons magic parentheses
+    return re.sub(r' +\$\)($| +)|(^| +)\$\( +', ' ', text)
+
+
+BUILD_DATA_MAGIC_COOKIE = b'__BUILD_DATA_MAGIC_COOKIE__'
+BUILD_RECORD_PATTERN = re.compile(rb'<(cc|cxx|ar|link|shcc|shcxx|shlink)>(.*)</\1>')
+BUILD_FIELD_PATTERN = re.compile(rb'<([a-z]+)>([^<]*)</\1>')
+COMPILE_TAGS = ['cc', 'cxx', 'shcc', 'shcxx']
+
+# the target identifies the record, the source follows from it, and timing is not a setting
+UNCOMPARED_FIELDS = [b'target', b'source', b'start', b'end']
+
+# settings repeat across almost all records, so each distinct value is only tokenised and hashed once
+tokenised_settings: Dict[Tuple[bytes, bytes], Tuple[frozenset, bytes]] = {}
+
+
+# Streams the build records out of a build report, which may be the raw SCons output or the filtered XML, without
+# parsing the whole document.  Yields the byte offset and length of each record along with its undecoded fields.
+def read_build_records(path: str):
+    with open(path, 'rb') as report:
+        offset = 0
+        for line in report:
+            if BUILD_DATA_MAGIC_COOKIE in line:
+                for record in BUILD_RECORD_PATTERN.finditer(line):
+                    yield offset + record.start(), record.end() - record.start(), record.group(1).decode(), dict(BUILD_FIELD_PATTERN.findall(record.group(2)))
+            offset += len(line)
+
+
+def read_build_record_at(path: str, offset: int, length: int) -> Dict[bytes, bytes]:
+    with open(path, 'rb') as report:
+        report.seek(offset)
+        _, raw_fields = parse_build_record(report.read(length))
+    return raw_fields
+
 
+def parse_build_record(content: bytes) -> (str, Dict[bytes, bytes]):
+    record = BUILD_RECORD_PATTERN.match(content)
+    return record.group(1).decode(), dict(BUILD_FIELD_PATTERN.findall(record.group(2)))
 
-main()
+
+def decode_build_field(raw: bytes) -> str:
+    return remove_scons_magic(raw.decode('utf-8', errors='replace'))
+
+
+def decode_build_fields(raw_fields: Dict[bytes, bytes]) -> Dict[str, str]:
+    return {name.decode(): decode_build_field(raw) for name, raw in raw_fields.items()}
+
+
+def split_setting(name: str, text: str) -> List[str]:
+    match name:
+        case 'include':
+            tokens = text.split('/I')
+        case 'libpath':
+            tokens = text.split('/LIBPATH:')
+        case 'define':
+            tokens = re.findall(r'/D([^ ]+)', text)
+        case _:
+            tokens = text.split()
+    return [token.strip() for token in tokens if len(token.strip()) > 0]
+
+
+def tokenise_setting(name: str, text: str) -> frozenset:
+    return frozenset(split_setting(name, text))
+
+
+def get_tokenised_setting(name: bytes, raw: bytes) -> Tuple[frozenset, bytes]:
+    key = (name, raw)
+    cached = tokenised_settings.get(key)
+    if cached is None:
+        tokens = tokenise_setting(name.decode(), decode_build_field(raw))
+        digest = hashlib.blake2b(name + b'\0' + '\0'.join(sorted(tokens)).encode(), digest_size=16).digest()
+        cached = (tokens, digest)
+        tokenised_settings[key] = cached
+    return cached
+
+
+def tokenise_record(raw_fields: Dict[bytes, bytes]) -> Dict[str, frozenset]:
+    return {name.decode(): get_tokenised_setting(name, raw)[0] for name, raw in raw_fields.items() if name not in UNCOMPARED_FIELDS}
+
+
+def hash_record(raw_fields: Dict[bytes, bytes]) -> bytes:
+    digest = hashlib.blake2b(digest_size=16)
+    for name in sorted(raw_fields.keys()):
+        if name not in UNCOMPARED_FIELDS:
+            digest.update(get_tokenised_setting(name, raw_fields[name])[1])
+    return digest.digest()
+
+
+def describe_setting_changes(old: Dict[str, frozenset], new: Dict[str, frozenset]) -> List[str]:
+    changes = []
+    for name in sorted(set(old.keys()) | set(new.keys())):
+        added = sorted(new.get(name, frozenset()) - old.get(name, frozenset()))
+        removed = sorted(old.get(name, frozenset()) - new.get(name, frozenset()))
+        if added or removed:
+            changes.append(f'{name}: {" ".join([f"+{token}" for token in added] + [f"-{token}" for token in removed])}')
+    return changes
+
+
+# Only a digest per translation unit is kept while streaming, so memory does not grow with the size of the settings.
+# Module records are few, so they are kept whole to work out which modules own the changed translation units.
+def diff_build_reports(old_path: str, new_path: str):
+    old_units: Dict[bytes, Tuple[bytes, int, int]] = {}
+    old_modules: Dict[str, Dict[str, frozenset]] = {}
+    for offset, length, tag, raw_fields in read_build_records(old_path):
+        if tag in COMPILE_TAGS:
+            old_units[raw_fields[b'target']] = (hash_record(raw_fields), offset, length)
+        else:
+            old_modules[get_target_basename(decode_build_field(raw_fields[b'target']))] = tokenise_record(raw_fields)
+
+    added_units: Dict[bytes, str] = {}
+    changed_units: Dict[bytes, Tuple[str, Dict[str, frozenset], int, int]] = {}
+    new_modules: Dict[str, Dict[str, frozenset]] = {}
+    new_units = set()
+    for offset, length, tag, raw_fields in read_build_records(new_path):
+        if tag in COMPILE_TAGS:
+            # if a target is built more than once, the last record wins
+            target = raw_fields[b'target']
+            new_units.add(target)
+            added_units.pop(target, None)
+            changed_units.pop(target, None)
+            old_unit = old_units.get(target)
+            if old_unit is None:
+                added_units[target] = decode_build_field(raw_fields[b'source'])
+            elif old_unit[0] != hash_record(raw_fields):
+                changed_units[target] = (decode_build_field(raw_fields[b'source']), tokenise_record(raw_fields), old_unit[1], old_unit[2])
+        else:
+            new_modules[get_target_basename(decode_build_field(raw_fields[b'target']))] = tokenise_record(raw_fields)
+
+    removed_units: Dict[bytes, str] = {}
+    for target, (_, offset, length) in old_units.items():
+        if target not in new_units:
+            removed_units[target] = decode_build_field(read_build_record_at(old_path, offset, length)[b'source'])
+
+    dirty_modules = set()
+    touched_units = {decode_build_field(target) for target in list(added_units) + list(removed_units) + list(changed_units)}
+    for module_records in [old_modules, new_modules]:
+        for name, tokenised in module_records.items():
+            if not touched_units.isdisjoint(tokenised.get('sources', frozenset())):
+                dirty_modules.add(name)
+
+    print(f'--- {old_path}')
+    print(f'+++ {new_path}')
+    print(f'added translation units ({len(added_units)}):')
+    for source in sorted(added_units.values()):
+        print(f'  + {source}')
+    print(f'removed translation units ({len(removed_units)}):')
+    for source in sorted(removed_units.values()):
+        print(f'  - {source}')
+    print(f'changed translation units ({len(changed_units)}):')
+    for source, tokenised, offset, length in sorted(changed_units.values(), key=lambda item: item[0]):
+        print(f'  * {source}')
+        for change in describe_setting_changes(tokenise_record(read_build_record_at(old_path, offset, length)), tokenised):
+            print(f'      {change}')
+
+    print('changed modules:')
+    for name in sorted(set(old_modules.keys()) | set(new_modules.keys())):
+        if name not in new_modules:
+            print(f'  - {name}')
+            dirty_modules.add(name)
+        elif name not in old_modules:
+            print(f'  + {name}')
+            dirty_modules.add(name)
+        else:
+            changes = describe_setting_changes(old_modules[name], new_modules[name])
+            if changes:
+                print(f'  * {name}')
+                for change in changes:
+                    print(f'      {change}')
+                dirty_modules.add(name)
+
+    print(f'modules to regenerate ({len(dirty_modules)}):')
+    for name in sorted(dirty_modules):
+        print(f'  {name}')
+
+
+# The side index maps every target, source path and module name in a build report to the byte offset and length
+# of its record, so single records can be decoded straight out of the report.
+def get_index_path(report_path: str) -> str:
+    return f'{report_path}.index'
+
+
+def get_index_header(report_path: str) -> str:
+    status = os.stat(report_path)
+    return f'# build report index {status.st_size} {status.st_mtime_ns}\n'
+
+
+def normalise_index_key(key: str) -> str:
+    return key.strip().replace('/', '\\').lower()
+
+
+def index_build_records(records) -> Dict[str, List[Tuple[int, int]]]:
+    index = {}
+    for offset, length, tag, raw_fields in records:
+        index_build_record(index, offset, length, tag, raw_fields)
+    return index
+
+
+def index_build_record(index: Dict[str, List[Tuple[int, int]]], offset: int, length: int, tag: str, raw_fields: Dict[bytes, bytes]):
+    target = decode_build_field(raw_fields[b'target'])
+    keys = [target]
+    if b'source' in raw_fields:
+        keys.append(decode_build_field(raw_fields[b'source']))
+    if tag not in COMPILE_TAGS:
+        keys.append(get_target_basename(target))
+    for key in keys:
+        index.setdefault(normalise_index_key(key), []).append((offset, length))
+
+
+# the index is sorted by key, so queries can binary search it without loading it
+def write_build_report_index(report_path: str, index: Dict[str, List[Tuple[int, int]]]):
+    with open(get_index_path(report_path), 'w', newline='\n') as index_file:
+        index_file.write(get_index_header(report_path))
+        for key in sorted(index.keys()):
+            for offset, length in index[key]:
+                index_file.write(f'{key}\t{offset}\t{length}\n')
+
+
+def is_index_current(report_path: str) -> bool:
+    index_path = get_index_path(report_path)
+    if not os.path.exists(index_path):
+        return False
+    with open(index_path, 'r', newline='\n') as index_file:
+        return index_file.readline() == get_index_header(report_path)
+
+
+def find_index_entries(index: mmap.mmap, key: str) -> List[Tuple[int, int]]:
+    normalised = normalise_index_key(key).encode()
+
+    # binary search for the first line with this key, skipping over the header
+    low = index.find(b'\n') + 1
+    high = len(index)
+    while low < high:
+        middle = (low + high) // 2
+        line_start = index.rfind(b'\n', 0, middle) + 1
+        if index[line_start:index.find(b'\t', line_start)] < normalised:
+            low = index.find(b'\n', middle) + 1
+        else:
+            high = line_start
+    entries = []
+    line_start = low
+    while line_start < len(index):
+        line_end = index.find(b'\n', line_start)
+        indexed_key, offset, length = index[line_start:line_end].split(b'\t')
+        if indexed_key != normalised:
+            break
+        entries.append((int(offset), int(length)))
+        line_start = line_end + 1
+    if len(entries) > 0:
+        return entries
+
+    # otherwise treat the key as the trailing part of a path
+    suffix_pattern = re.compile(rb'^[^\t\n]*\\' + re.escape(normalised) + rb'\t(\d+)\t(\d+)$', re.MULTILINE)
+    for match in suffix_pattern.finditer(index):
+        location = (int(match.group(1)), int(match.group(2)))
+        if location not in entries:
+            entries.append(location)
+    return entries
+
+
+def print_build_record(tag: str, raw_fields: Dict[bytes, bytes], field_names: List[str] | None):
+    fields = decode_build_fields(raw_fields)
+    print(f'{tag} {fields["target"]}')
+    for name, text in fields.items():
+        if name == 'target' or (field_names and name not in field_names):
+            continue
+        tokens = split_setting(name, text)
+        if len(tokens) > 1:
+            print(f'  {name}:')
+            for token in tokens:
+                print(f'    {token}')
+        else:
+            print(f'  {name}: {text.strip()}'.rstrip())
+
+
+def query_build_report(report_path: str, keys: List[str], field_names: List[str] | None):
+    records = None
+    if not is_index_current(report_path):
+        print(f'indexing {report_path}')
+        indexed = list(read_build_records(report_path))
+        write_build_report_index(report_path, index_build_records(indexed))
+        # the records just read for the index answer the query, so the report isn't read again
+        records = {offset: (tag, raw_fields) for offset, _, tag, raw_fields in indexed}
+
+    with open(get_index_path(report_path), 'rb') as index_file, mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ) as index:
+        entries = {key: find_index_entries(index, key) for key in keys}
+    if records is None:
+        records = read_indexed_records(report_path, [location for locations in entries.values() for location in locations])
+
+    for key in keys:
+        if len(entries[key]) < 1:
+            print(f'{key} not found in {report_path}')
+            continue
+        for offset, _ in entries[key]:
+            tag, raw_fields = records[offset]
+            print_build_record(tag, raw_fields, field_names)
+
+
+def read_indexed_records(report_path: str, locations: List[Tuple[int, int]]) -> Dict[int, Tuple[str, Dict[bytes, bytes]]]:
+    records = {}
+    # an empty report has nothing indexed, and can't be mapped
+    if len(locations) < 1:
+        return records
+    with open(report_path, 'rb') as report, mmap.mmap(report.fileno(), 0, access=mmap.ACCESS_READ) as content:
+        for offset, length in locations:
+            records[offset] = parse_build_record(content[offset:offset + length])
+    return records
+
+
+# several build reports are parsed in worker processes, which import this file again
+if __name__ == '__main__':
+    match options.command:
+        case 'diff':
+            diff_build_reports(options.old_report_path, options.new_report_path)
+        case 'query':
+            query_build_report(options.build_report_path, options.keys, options.field)
+        case _:
+            main()
@@ -0,0 +1,50 @@
+# MIT License
+#
+# Copyright (c) 2022 Ammo Goettsch
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Imports the generator for the tests, which parses its command line as soon as it is imported
+import contextlib
+import importlib
+import io
+import pathlib
+import sys
+
+REBUILD_PATH = pathlib.Path(__file__).resolve().parent.parent
+FIXTURES_PATH = pathlib.Path(__file__).resolve().parent / 'fixtures'
+
+
+# returns the create_build_from_log module, imported as if generating projects for the fixture report
+def import_generator():
+    if str(REBUILD_PATH) not in sys.path:
+        sys.path.insert(0, str(REBUILD_PATH))
+    arguments = sys.argv
+    sys.argv = ['create_build_from_log.py', str(FIXTURES_PATH / 'report.txt')]
+    try:
+        return importlib.import_module('create_build_from_log')
+    finally:
+        sys.argv = arguments
+
+
+# runs a function of the generator and returns what it printed
+def capture_output(function, *arguments) -> str:
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        function(*arguments)
+    return output.getvalue()
@@ -0,0 +1,139 @@
+# MIT License
+#
+# Copyright (c) 2022 Ammo Goettsch
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Reading configurations from build reports and merging the documents generated for them
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from xml.etree import ElementTree as xml
+
+from generator import FIXTURES_PATH, import_generator
+
+generator = import_generator()
+
+DEBUG = 'Debug|x64'
+RELEASE = 'Release|x64'
+RELEASE_DEBUG = 'ReleaseDebug|x64'
+
+
+def parse(text: str) -> xml.Element:
+    return xml.fromstring(f'<Project>{text}</Project>')
+
+
+def merge(variants: dict) -> str:
+    merged = xml.Element('Project')
+    generator.merge_configurations(merged, {condition: parse(text) for condition, text in variants.items()}, list(variants.keys()))
+    return xml.tostring(merged, encoding='unicode')
+
+
+def condition(*conditions: str) -> str:
+    return generator.get_condition_expression(list(conditions))
+
+
+class MergeConfigurationsTest(unittest.TestCase):
+    def test_same_documents(self):
+        document = '<PropertyGroup><OutDir>bin</OutDir></PropertyGroup><ItemGroup><ClCompile Include="a.cpp" /></ItemGroup>'
+        self.assertEqual(merge({DEBUG: document, RELEASE: document}), f'<Project>{document}</Project>')
+
+    def test_different_settings(self):
+        merged = merge({
+            DEBUG: '<ItemDefinitionGroup><ClCompile><Optimization>Disabled</Optimization><WarningLevel>Level3</WarningLevel></ClCompile></ItemDefinitionGroup>',
+            RELEASE: '<ItemDefinitionGroup><ClCompile><Optimization>MaxSpeed</Optimization><WarningLevel>Level3</WarningLevel></ClCompile></ItemDefinitionGroup>',
+            RELEASE_DEBUG: '<ItemDefinitionGroup><ClCompile><Optimization>MaxSpeed</Optimization><WarningLevel>Level3</WarningLevel></ClCompile></ItemDefinitionGroup>',
+        })
+        self.assertEqual(merged, '<Project><ItemDefinitionGroup><ClCompile>'
+                                 f'<Optimization Condition="{condition(DEBUG)}">Disabled</Optimization>'
+                                 f'<Optimization Condition="{condition(RELEASE, RELEASE_DEBUG)}">MaxSpeed</Optimization>'
+                                 '<WarningLevel>Level3</WarningLevel>'
+                                 '</ClCompile></ItemDefinitionGroup></Project>')
+
+    def test_items_in_some_configurations(self):
+        merged = merge({
+            DEBUG: '<ItemGroup><ClCompile Include="a.cpp" /><ClCompile Include="debug.cpp"><ObjectFileName>d.obj</ObjectFileName></ClCompile></ItemGroup>',
+            RELEASE: '<ItemGroup><ClCompile Include="a.cpp" /></ItemGroup>',
+        })
+        self.assertEqual(merged, '<Project><ItemGroup><ClCompile Include="a.cpp" />'
+                                 f'<ClCompile Include="debug.cpp" Condition="{condition(DEBUG)}"><ObjectFileName>d.obj</ObjectFileName></ClCompile>'
+                                 '</ItemGroup></Project>')
+
+    def test_repeated_elements(self):
+        # a setting that occurs twice is matched by occurrence, not merged into one
+        merged = merge({
+            DEBUG: '<Import Project="a.props" /><Import Project="a.props" />',
+            RELEASE: '<Import Project="a.props" />',
+        })
+        self.assertEqual(merged, f'<Project><Import Project="a.props" /><Import Project="a.props" Condition="{condition(DEBUG)}" /></Project>')
+
+
+class ConfigurationTest(unittest.TestCase):
+    def test_read_configuration(self):
+        with tempfile.TemporaryDirectory() as directory:
+            report_path = os.path.join(directory, 'report.txt')
+            shutil.copyfile(FIXTURES_PATH / 'report.txt', report_path)
+            configuration = generator.read_configuration(report_path, False)
+            self.assertFalse(os.path.exists(generator.get_index_path(report_path)))
+            generator.read_configuration(report_path, True)
+            self.assertTrue(generator.is_index_current(report_path))
+            # indexing while decoding gives the same index as indexing on its own
+            with open(generator.get_index_path(report_path)) as index_file:
+                indexed = index_file.read()
+            generator.write_build_report_index(report_path, generator.index_build_records(generator.read_build_records(report_path)))
+            with open(generator.get_index_path(report_path)) as index_file:
+                self.assertEqual(index_file.read(), indexed)
+        self.assertEqual(len(configuration.cxx), 8)
+        self.assertEqual(list(configuration.ar.keys()), ['core/core', 'scene/scene'])
+        self.assertEqual(list(configuration.link.keys()), ['bin/godot'])
+        # SCons magic is removed while decoding
+        self.assertEqual(configuration.cxx['core/os/os.windows.tools.x86_64.obj']['ccflags'].split(), ['/nologo', '/W3', '/Zi', '/TP'])
+        # configurations come back from the worker processes pickled
+        self.assertEqual(pickle.loads(pickle.dumps(configuration)), configuration)
+
+    def test_build_flavor(self):
+        configuration = generator.read_configuration(str(FIXTURES_PATH / 'report.txt'), False)
+        self.assertEqual(generator.detect_build_flavor(configuration), '.windows.tools.x86_64')
+
+    def test_configuration_names(self):
+        self.assertEqual(generator.get_configuration_name('.windows.tools.x86_64', []), 'Debug')
+        self.assertEqual(generator.get_configuration_name('.windows.opt.tools.x86_64', []), 'ReleaseDebug')
+        self.assertEqual(generator.get_configuration_name('.windows.opt.x86_64', []), 'Release')
+        self.assertEqual(generator.get_configuration_name('.windows.opt.tools.x86_64.mono', []), 'OptToolsMono')
+
+    def test_configuration_names_are_unique(self):
+        # "Debug" is kept for the tools build, even when it isn't one of the build reports
+        self.assertEqual(generator.get_configuration_name('.windows.debug.x86_64', []), 'Debug2')
+        self.assertEqual(generator.get_configuration_name('.windows.debug.x86_64', ['Debug2']), 'Debug3')
+        self.assertEqual(generator.get_configuration_name('.windows.tools.x86_64', ['Debug']), 'Debug2')
+        with self.assertRaisesRegex(NotImplementedError, '--configuration'):
+            generator.get_configuration_name('.windows.x86_64', [])
+
+    def test_same_build_flavor_twice(self):
+        report_path = str(FIXTURES_PATH / 'report.txt')
+        with mock.patch.multiple(generator.options, build_report_path=[report_path, report_path], build_flavor=None,
+                                 configuration=None, dry_run=True, verbose=False):
+            configurations = generator.load_configurations()
+        self.assertEqual([configuration.name for configuration in configurations], ['Debug', 'Debug2'])
+
+if __name__ == '__main__':
+    unittest.main()
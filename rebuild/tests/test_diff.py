@@ -0,0 +1,63 @@
+# MIT License
+#
+# Copyright (c) 2022 Ammo Goettsch
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Comparing the fixture report with a later build that added, removed and changed translation units
+import subprocess
+import sys
+import unittest
+
+from generator import FIXTURES_PATH, REBUILD_PATH, capture_output, import_generator
+
+generator = import_generator()
+
+OLD_REPORT = str(FIXTURES_PATH / 'report.txt')
+NEW_REPORT = str(FIXTURES_PATH / 'report_changed.txt')
+
+
+class DiffTest(unittest.TestCase):
+    def test_changes(self):
+        output = capture_output(generator.diff_build_reports, OLD_REPORT, NEW_REPORT)
+        self.assertIn('added translation units (1):\n  + scene/gui/button.cpp\n', output)
+        self.assertIn('removed translation units (1):\n  - core/io/file_access.cpp\n', output)
+        self.assertIn('changed translation units (1):\n  * core/io/file.cpp\n      define: +EXTRA\n', output)
+        self.assertIn('  * core/core\n      sources: -core/io/file_access.windows.tools.x86_64.obj\n', output)
+        self.assertTrue(output.endswith('modules to regenerate (2):\n  core/core\n  scene/scene\n'), output)
+
+    def test_same_report(self):
+        output = capture_output(generator.diff_build_reports, OLD_REPORT, OLD_REPORT)
+        for heading in ['added translation units (0):', 'removed translation units (0):', 'changed translation units (0):',
+                        'modules to regenerate (0):']:
+            self.assertIn(heading, output)
+
+    def test_ignores_timing_and_scons_magic(self):
+        old_fields = {b'target': b'a.obj', b'source': b'a.cpp', b'ccflags': b'/nologo $( /TP $)', b'start': b'1.0', b'end': b'2.0'}
+        new_fields = {**old_fields, b'ccflags': b'/TP /nologo', b'end': b'7.0'}
+        self.assertEqual(generator.hash_record(old_fields), generator.hash_record(new_fields))
+
+    def test_subcommand(self):
+        result = subprocess.run([sys.executable, 'create_build_from_log.py', 'diff', OLD_REPORT, NEW_REPORT],
+                                cwd=REBUILD_PATH, capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout, capture_output(generator.diff_build_reports, OLD_REPORT, NEW_REPORT))
+
+
+if __name__ == '__main__':
+    unittest.main()
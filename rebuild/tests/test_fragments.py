@@ -0,0 +1,106 @@
+# MIT License
+#
+# Copyright (c) 2022 Ammo Goettsch
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Sharing generated files between checkouts through the fragment store
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from generator import import_generator
+
+generator = import_generator()
+
+MODULE_KEY = bytes(16)
+
+
+class FragmentStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = mock.patch.object(generator.options, 'fragment_store', os.path.join(self.directory.name, 'store'))
+        self.store.start()
+        self.checkouts = []
+        for name in ['first', 'second']:
+            os.mkdir(os.path.join(self.directory.name, name))
+            self.checkouts.append(os.path.join(self.directory.name, name))
+        self.written = []
+
+    def tearDown(self):
+        self.store.stop()
+        self.directory.cleanup()
+
+    def write(self, path: str):
+        self.written.append(path)
+        with open(path, 'w') as generated:
+            generated.write('generated')
+
+    def write_fragments(self, checkout: str, file_name: str, editable: bool) -> str:
+        path = os.path.join(checkout, file_name)
+        generator.write_fragment(path, MODULE_KEY, self.write, editable)
+        return path
+
+    def test_properties_are_linked(self):
+        first = self.write_fragments(self.checkouts[0], 'Sources.properties', False)
+        second = self.write_fragments(self.checkouts[1], 'Sources.properties', False)
+        self.assertEqual(self.written, [first])
+        # the generated file is copied into the store, and later checkouts link to the copy
+        stored = generator.get_fragment_path(MODULE_KEY, 'Sources.properties')
+        self.assertFalse(os.path.samefile(first, stored))
+        self.assertTrue(os.path.samefile(second, stored))
+
+    def test_filters_are_copied(self):
+        first = self.write_fragments(self.checkouts[0], 'core_open.vcxproj.filters', True)
+        second = self.write_fragments(self.checkouts[1], 'core_open.vcxproj.filters', True)
+        self.assertEqual(self.written, [first])
+        self.assertFalse(os.path.samefile(first, second))
+        self.assertEqual(os.stat(second).st_nlink, 1)
+        # saving the filters in the IDE doesn't change the store
+        with open(second, 'w') as filters:
+            filters.write('edited')
+        with open(generator.get_fragment_path(MODULE_KEY, 'core_open.vcxproj.filters')) as stored:
+            self.assertEqual(stored.read(), 'generated')
+
+    def test_copy_over_link(self):
+        # filters linked by an earlier version of the generator are replaced, not written through
+        self.write_fragments(self.checkouts[0], 'core_open.vcxproj.filters', False)
+        linked = self.write_fragments(self.checkouts[1], 'core_open.vcxproj.filters', False)
+        stored = generator.get_fragment_path(MODULE_KEY, 'core_open.vcxproj.filters')
+        self.assertEqual(os.stat(stored).st_nlink, 2)
+        self.write_fragments(self.checkouts[1], 'core_open.vcxproj.filters', True)
+        self.assertEqual(os.stat(stored).st_nlink, 1)
+        self.assertEqual(os.stat(linked).st_nlink, 1)
+
+    def test_different_key(self):
+        self.write_fragments(self.checkouts[0], 'Sources.properties', False)
+        other_path = os.path.join(self.checkouts[1], 'Sources.properties')
+        generator.write_fragment(other_path, bytes(15) + b'\1', self.write, False)
+        self.assertEqual(len(self.written), 2)
+
+    def test_without_store(self):
+        path = os.path.join(self.checkouts[0], 'Sources.properties')
+        generator.write_fragment(path, None, self.write)
+        self.assertEqual(self.written, [path])
+        self.assertFalse(os.path.exists(generator.options.fragment_store))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+# MIT License
+#
+# Copyright (c) 2022 Ammo Goettsch
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Streaming project files gives the same bytes as building the document with ElementTree and indenting it
+import io
+import unittest
+from xml.etree import ElementTree as xml
+
+from generator import REBUILD_PATH, import_generator
+
+generator = import_generator()
+
+TEMPLATE_PATH = REBUILD_PATH / 'templates' / 'vs19' / 'include_project.xml'
+
+
+# how projects were written before they were streamed
+def write_with_element_tree(create) -> bytes:
+    document = xml.parse(TEMPLATE_PATH)
+    builder = generator.ProjectBuilder()
+    builder.start('Project')
+    create(builder)
+    builder.end('Project')
+    for child in builder.close():
+        document.getroot().append(child)
+    xml.indent(document)
+    output = io.BytesIO()
+    output.write('<?xml version="1.0" encoding="utf-8"?>\n'.encode('utf-8'))
+    document.write(output, encoding='utf-8', method='xml')
+    content = output.getvalue()
+    return content.replace(b'\r\r', b'\r').replace(b'\r\n', b'\n').replace(b'\n', b'\r\n')
+
+
+def write_streamed(create) -> bytes:
+    writer = generator.ProjectWriter(xml.parse(TEMPLATE_PATH).getroot().attrib)
+    create(writer)
+    return writer.getvalue()
+
+
+def create_settings(writer):
+    writer.start('ItemDefinitionGroup', {'Condition': "'$(Configuration)|$(Platform)'=='Debug|x64'"})
+    writer.start('ClCompile')
+    writer.element('PreprocessorDefinitions', 'TOOLS_ENABLED;NAME="a<b>&c";%(PreprocessorDefinitions)')
+    writer.element('AdditionalOptions', '')
+    writer.element('WarningLevel', 'Level3')
+    writer.end('ClCompile')
+    writer.end('ItemDefinitionGroup')
+    writer.start('ItemGroup')
+    writer.element('ClCompile', None, {'Include': 'core\\a & b.cpp'})
+    writer.start('ClCompile', {'Include': 'core\\"quoted"\tname\r\n.cpp'})
+    writer.element('ObjectFileName', '$(IntDir)\\é.obj')
+    writer.end('ClCompile')
+    writer.end('ItemGroup')
+    writer.start('PropertyGroup')
+    writer.end('PropertyGroup')
+
+
+class ProjectWriterTest(unittest.TestCase):
+    def test_same_as_element_tree(self):
+        self.assertEqual(write_streamed(create_settings), write_with_element_tree(create_settings))
+
+    def test_empty_project(self):
+        def create_nothing(writer):
+            pass
+
+        self.assertEqual(write_streamed(create_nothing), write_with_element_tree(create_nothing))
+
+    def test_merged_elements(self):
+        # parsed elements carry the namespace on their tags, which isn't written again
+        element = xml.fromstring(f'<Project xmlns="{generator.PROJECT_NAMESPACE}"><ItemGroup><None Include="a.txt" /></ItemGroup></Project>')
+
+        def create_from_element(writer):
+            for child in element:
+                generator.write_element(writer, child)
+
+        streamed = write_streamed(create_from_element)
+        self.assertEqual(streamed, write_with_element_tree(create_from_element))
+        self.assertIn(b'\r\n  <ItemGroup>\r\n    <None Include="a.txt" />\r\n  </ItemGroup>\r\n</Project>', streamed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+# MIT License
+#
+# Copyright (c) 2022 Ammo Goettsch
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Indexing the fixture report and querying single records through the index
+import mmap
+import os
+import shutil
+import tempfile
+import unittest
+
+from generator import FIXTURES_PATH, capture_output, import_generator
+
+generator = import_generator()
+
+
+class QueryTest(unittest.TestCase):
+    def setUp(self):
+        # the index is written next to the report
+        self.directory = tempfile.TemporaryDirectory()
+        self.report_path = os.path.join(self.directory.name, 'report.txt')
+        shutil.copyfile(FIXTURES_PATH / 'report.txt', self.report_path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def find_entries(self, key: str) -> list:
+        with open(generator.get_index_path(self.report_path), 'rb') as index_file, \
+                mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ) as index:
+            return generator.find_index_entries(index, key)
+
+    def get_targets(self, key: str) -> list:
+        return [generator.read_build_record_at(self.report_path, offset, length)[b'target'].decode()
+                for offset, length in self.find_entries(key)]
+
+    def write_index(self):
+        generator.write_build_report_index(self.report_path, generator.index_build_records(generator.read_build_records(self.report_path)))
+
+    def test_find_index_entries(self):
+        self.write_index()
+        self.assertEqual(self.get_targets('core/io/file.windows.tools.x86_64.obj'), ['core/io/file.windows.tools.x86_64.obj'])
+        self.assertEqual(self.get_targets('Core\\IO\\File.cpp'), ['core/io/file.windows.tools.x86_64.obj'])
+        self.assertEqual(self.get_targets('scene/scene'), ['scene/scene.windows.tools.x86_64.lib'])
+        self.assertEqual(self.get_targets('bin/godot'), ['bin/godot.windows.tools.x86_64.exe'])
+        self.assertEqual(self.get_targets('missing.cpp'), [])
+
+    def test_find_by_trailing_path(self):
+        self.write_index()
+        self.assertEqual(self.get_targets('gui/label.cpp'), ['scene/gui/label.windows.tools.x86_64.obj'])
+        # matches whole path components only
+        self.assertEqual(self.get_targets('file.cpp'), ['core/io/file.windows.tools.x86_64.obj'])
+        self.assertEqual(self.get_targets('access.cpp'), [])
+
+    def test_every_key_is_found(self):
+        self.write_index()
+        with open(generator.get_index_path(self.report_path), 'r') as index_file:
+            lines = index_file.read().splitlines()[1:]
+        self.assertEqual(lines, sorted(lines))
+        for line in lines:
+            key, offset, length = line.split('\t')
+            self.assertIn((int(offset), int(length)), self.find_entries(key))
+
+    def test_query(self):
+        self.assertFalse(generator.is_index_current(self.report_path))
+        indexing = capture_output(generator.query_build_report, self.report_path, ['node.cpp', 'core/core'], ['define'])
+        self.assertTrue(generator.is_index_current(self.report_path))
+        indexed = capture_output(generator.query_build_report, self.report_path, ['node.cpp', 'core/core'], ['define'])
+        self.assertEqual(indexing, f'indexing {self.report_path}\n' + indexed)
+        self.assertEqual(indexed, 'cxx scene/main/node.windows.tools.x86_64.obj\n'
+                                  '  define:\n    TOOLS_ENABLED\n    DEBUG_ENABLED\n'
+                                  'ar core/core.windows.tools.x86_64.lib\n')
+
+    def test_stale_index(self):
+        self.write_index()
+        with open(self.report_path, 'a') as report:
+            report.write('more output\n')
+        self.assertFalse(generator.is_index_current(self.report_path))
+        self.assertIn('indexing', capture_output(generator.query_build_report, self.report_path, ['os.cpp'], None))
+
+    def test_empty_report(self):
+        open(self.report_path, 'w').close()
+        for _ in range(2):
+            self.assertEqual(capture_output(generator.query_build_report, self.report_path, ['node.cpp'], None).splitlines()[-1],
+                             f'node.cpp not found in {self.report_path}')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+# MIT License
+#
+# Copyright (c) 2022 Ammo Goettsch
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Splitting large modules into shards along their folders, and sharing processors between the projects
+import pathlib
+import unittest
+from unittest import mock
+
+from generator import FIXTURES_PATH, capture_output, import_generator
+
+generator = import_generator()
+
+WEIGHTS = {
+    'core/io/a.cpp': 10,
+    'core/io/b.cpp': 10,
+    'core/math/c.cpp': 10,
+    'core/math/d.cpp': 10,
+    'core/os/e.cpp': 10,
+    'core/f.cpp': 10,
+}
+
+
+def get_shard_indices(shard_units: list, compile_paths) -> dict:
+    files = {}
+    subtrees = {}
+    for index, units in enumerate(shard_units):
+        for unit in units:
+            (subtrees if unit.subtree else files)[unit.directory] = index
+    return {compile_path: generator.find_shard(pathlib.Path(compile_path).parent, files, subtrees) for compile_path in compile_paths}
+
+
+class PartitionSourcesTest(unittest.TestCase):
+    def test_whole_folders(self):
+        shards = generator.partition_sources(WEIGHTS, 2)
+        self.assertEqual([[(str(unit.directory), unit.subtree) for unit in units] for units in shards], [
+            [(str(pathlib.Path('core/io')), True), ('core', False)],
+            [(str(pathlib.Path('core/math')), True), (str(pathlib.Path('core/os')), True)],
+        ])
+        self.assertEqual([sum(unit.weight for unit in units) for units in shards], [30, 30])
+
+    def test_every_source_in_one_shard(self):
+        weights = {f'scene/{folder}/{subfolder}/f{index}.cpp': index + 1
+                   for folder in ['2d', '3d', 'gui', 'main'] for subfolder in ['a', 'b', 'c'] for index in range(5)}
+        weights['scene/register_scene_types.cpp'] = 4
+        for shard_count in range(2, 8):
+            shards = generator.partition_sources(weights, shard_count)
+            self.assertLessEqual(len(shards), shard_count)
+            indices = get_shard_indices(shards, weights.keys())
+            self.assertNotIn(None, indices.values())
+            loads = [0] * len(shards)
+            for compile_path, index in indices.items():
+                loads[index] += weights[compile_path]
+            # folders aren't split, so a shard can be over the average by up to one folder
+            self.assertLessEqual(max(loads), sum(weights.values()) / shard_count + 15, shard_count)
+
+    def test_files_in_one_folder_stay_together(self):
+        weights = {f'core/f{index}.cpp': 1 for index in range(20)}
+        shards = generator.partition_sources(weights, 4)
+        self.assertEqual(len(shards), 1)
+
+    def test_order_does_not_matter(self):
+        reversed_weights = dict(reversed(list(WEIGHTS.items())))
+        self.assertEqual(generator.partition_sources(reversed_weights, 3), generator.partition_sources(WEIGHTS, 3))
+
+    def test_shard_count(self):
+        with mock.patch.object(generator.options, 'shard_sources', 4), mock.patch.object(generator.options, 'shard_bytes', 0):
+            self.assertEqual(generator.get_shard_count(WEIGHTS, {}), 2)
+        with mock.patch.object(generator.options, 'shard_sources', 0), mock.patch.object(generator.options, 'shard_bytes', 1000):
+            self.assertEqual(generator.get_shard_count(WEIGHTS, dict.fromkeys(WEIGHTS, 700)), 5)
+
+
+class BalanceProcessorsTest(unittest.TestCase):
+    def setUp(self):
+        self.configuration = generator.read_configuration(str(FIXTURES_PATH / 'report.txt'), False)
+        self.configuration.name = 'Debug'
+
+    def test_balance_by_compile_time(self):
+        compile_times = {'a': (10.0, 20), 'b': (5.0, 20), 'c': (0.1, 1), 'd': (0.0, 0)}
+        self.assertEqual(generator.balance_processors(self.configuration, compile_times, 8), {'a': 8, 'b': 4, 'c': 1})
+
+    def test_no_timing(self):
+        output = capture_output(lambda: self.assertEqual(generator.balance_processors(self.configuration, {'a': (0.0, 3)}, 8), {}))
+        self.assertIn('has no timing data', output)
+
+    def test_shards_are_balanced_instead_of_their_module(self):
+        condition = self.configuration.condition
+
+        def create_module(name: str, data: dict, sources=(), shards=()) -> dict:
+            return {condition: generator.ModuleInfo(pathlib.Path(name), name, data, sources=dict.fromkeys(sources, {}), shards=list(shards))}
+
+        core = self.configuration.ar['core/core']
+        modules = {
+            'core/core': create_module('core/core', core, shards=['core/core_shard1', 'core/core_shard2']),
+            'core/core_shard1': create_module('core/core_shard1', core, ['core/io/file.cpp', 'core/io/file_access.cpp']),
+            'core/core_shard2': create_module('core/core_shard2', core, ['core/os/os.cpp', 'core/math/vector2.cpp']),
+            'scene/scene': create_module('scene/scene', self.configuration.ar['scene/scene']),
+            'bin/godot': create_module('bin/godot', self.configuration.link['bin/godot']),
+        }
+        with mock.patch.dict(generator.modules, modules, clear=True):
+            generator.assign_processors(self.configuration, 4)
+            processor_numbers = {name: variants[condition].processor_number for name, variants in generator.modules.items()}
+        # the fixture's compile times grow with the length of the source path, so scene has the most
+        self.assertEqual(processor_numbers, {
+            'core/core': 0,
+            'core/core_shard1': 2,
+            'core/core_shard2': 2,
+            'scene/scene': 3,
+            'bin/godot': 1,
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+# MIT License
+#
+# Copyright (c) 2022 Ammo Goettsch
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# The build timing report made from the start and end times in the fixture report
+import os
+import tempfile
+import unittest
+
+from generator import FIXTURES_PATH, capture_output, import_generator
+
+generator = import_generator()
+
+
+class TimingReportTest(unittest.TestCase):
+    def setUp(self):
+        self.configuration = generator.read_configuration(str(FIXTURES_PATH / 'report.txt'), False)
+        self.configuration.build_flavor = generator.detect_build_flavor(self.configuration)
+
+    def write_timing_report(self) -> list:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'timing.txt')
+            generator.write_timing_report(self.configuration, path)
+            with open(path) as report:
+                return report.read().splitlines()
+
+    def test_report(self):
+        lines = self.write_timing_report()
+        self.assertEqual(lines[2], 'Slowest translation units (of 8):')
+        self.assertEqual(lines[3].split(), ['4.400s', 'platform/windows/godot_windows.cpp', '(bin/godot)'])
+        totals = lines[lines.index('Per-module totals (compile, translation units, archive or link):') + 1:][:3]
+        self.assertEqual([line.split() for line in totals], [
+            ['11.400s', '4', '0.500s', 'core/core'],
+            ['8.900s', '3', '0.500s', 'scene/scene'],
+            ['4.400s', '1', '2.000s', 'bin/godot'],
+        ])
+        self.assertEqual(lines[-3:], [
+            'Link critical path for bin/godot.windows.tools.x86_64.exe: 6.400s',
+            '     4.400s  compile platform/windows/godot_windows.cpp',
+            '     2.000s  link bin/godot',
+        ])
+
+    def test_critical_path_through_library(self):
+        self.configuration.cxx['core/io/file_access.windows.tools.x86_64.obj']['end'] = '20.0'
+        lines = self.write_timing_report()
+        self.assertEqual(lines[-4:], [
+            'Link critical path for bin/godot.windows.tools.x86_64.exe: 22.000s',
+            '    19.500s  compile core/io/file_access.cpp',
+            '     0.500s  archive core/core',
+            '     2.000s  link bin/godot',
+        ])
+
+    def test_no_timing(self):
+        for records in [self.configuration.cxx, self.configuration.ar, self.configuration.link]:
+            for data in records.values():
+                data.pop('start')
+                data.pop('end')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'timing.txt')
+            output = capture_output(generator.write_timing_report, self.configuration, path)
+            self.assertFalse(os.path.exists(path))
+        self.assertIn('has no timing data', output)
+
+
+if __name__ == '__main__':
+    unittest.main()
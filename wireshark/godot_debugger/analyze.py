@@ -0,0 +1,150 @@
+# MIT License
+#
+# Copyright (c) 2022 Ammo Goettsch
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+import argparse
+import ipaddress
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from .pcap import read_tcp_segments
+from .stream import MessageSplitter, TcpStream
+from .variant import FRAME_HEADER_SIZE
+
+# same port as the dissector registers for
+DEFAULT_PORT = 6007
+
+
+@dataclass
+class CommandStatistics:
+    messages: int = 0
+    bytes: int = 0
+    largest: int = 0
+
+    def add(self, size: int):
+        self.messages += 1
+        self.bytes += size
+        self.largest = max(self.largest, size)
+
+
+@dataclass
+class DirectionStatistics:
+    name: str
+    commands: Dict[str, CommandStatistics] = field(default_factory=dict)
+
+    def add(self, timestamp: float, offset: int, stream: int, size: int, command: str):
+        statistics = self.commands.get(command)
+        if statistics is None:
+            statistics = CommandStatistics()
+            self.commands[command] = statistics
+        statistics.add(FRAME_HEADER_SIZE + size)
+
+
+@dataclass
+class CaptureStatistics:
+    packets: int = 0
+    captured_bytes: int = 0
+    first_timestamp: float | None = None
+    last_timestamp: float | None = None
+    directions: Dict[Tuple, DirectionStatistics] = field(default_factory=dict)
+    streams: Dict[Tuple, TcpStream] = field(default_factory=dict)
+
+
+def format_endpoint(endpoint: Tuple[bytes, int]) -> str:
+    address = ipaddress.ip_address(endpoint[0])
+    if address.version == 6:
+        return f'[{address}]:{endpoint[1]}'
+    return f'{address}:{endpoint[1]}'
+
+
+def analyze_capture(path: str, ports: List[int]) -> CaptureStatistics:
+    statistics = CaptureStatistics()
+    with open(path, 'rb') as capture:
+        for segment in read_tcp_segments(capture):
+            statistics.packets += 1
+            if statistics.first_timestamp is None:
+                statistics.first_timestamp = segment.timestamp
+            statistics.last_timestamp = segment.timestamp
+            if segment.destination[1] in ports:
+                name = 'game -> editor'
+            elif segment.source[1] in ports:
+                name = 'editor -> game'
+            else:
+                continue
+            statistics.captured_bytes += len(segment.payload)
+            key = (segment.source, segment.destination)
+            stream = statistics.streams.get(key)
+            if stream is None:
+                direction = DirectionStatistics(f'{name} ({format_endpoint(segment.source)} -> {format_endpoint(segment.destination)})')
+                statistics.directions[key] = direction
+                stream = TcpStream(MessageSplitter(direction.add))
+                statistics.streams[key] = stream
+            stream.feed(segment.sequence, segment.flags, segment.payload, segment.timestamp)
+    return statistics
+
+
+def print_report(path: str, statistics: CaptureStatistics, sort_key: str):
+    duration = 0.0
+    if statistics.first_timestamp is not None:
+        duration = statistics.last_timestamp - statistics.first_timestamp
+    print(f'{path}: {statistics.packets} TCP packets, {statistics.captured_bytes} bytes of debugger traffic in {duration:.3f}s')
+    for key, direction in statistics.directions.items():
+        stream = statistics.streams[key]
+        messages = sum(command.messages for command in direction.commands.values())
+        total = sum(command.bytes for command in direction.commands.values())
+        print()
+        print(f'{direction.name}: {messages} messages, {total} bytes')
+        if stream.ignored_bytes > 0:
+            reason = 'segments missing from capture' if stream.lost else 'capture started after the connection'
+            print(f'  {stream.ignored_bytes} bytes not decoded ({reason})')
+        if messages < 1:
+            continue
+        # rates are over the whole capture, so both directions are comparable
+        span = max(duration, 1e-6)
+        print(f'  {"command":<40} {"messages":>10} {"bytes":>14} {"average":>10} {"largest":>10} {"msg/s":>10} {"bytes/s":>12}')
+        for command, command_statistics in sorted(direction.commands.items(), key=lambda item: getattr(item[1], sort_key), reverse=True):
+            print(f'  {command:<40} {command_statistics.messages:>10} {command_statistics.bytes:>14} '
+                  f'{command_statistics.bytes // command_statistics.messages:>10} {command_statistics.largest:>10} '
+                  f'{command_statistics.messages / span:>10.1f} {command_statistics.bytes / span:>12.1f}')
+
+
+def main():
+    command_line = argparse.ArgumentParser(
+        prog='python -m godot_debugger',
+        description="Decode Godot RemoteDebugger traffic in pcap/pcapng captures and report per-command message counts, sizes and rates",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    command_line.add_argument('capture_path', type=str, nargs='+', help='pcap or pcapng files to analyze')
+    command_line.add_argument('--port', '-p', type=int, action='append',
+                              help=f'TCP port the editor listens on for the debugger connection (default {DEFAULT_PORT})')
+    command_line.add_argument('--sort', type=str, default='bytes', choices=['bytes', 'messages', 'largest'],
+                              help='order of commands in the report')
+    command_line.add_argument('--verbose', default=False, action='store_true', help='prints some more verbose output')
+    options = command_line.parse_args()
+
+    for path in options.capture_path:
+        started = time.perf_counter()
+        statistics = analyze_capture(path, options.port or [DEFAULT_PORT])
+        elapsed = time.perf_counter() - started
+        print_report(path, statistics, options.sort)
+        if options.verbose:
+            print()
+            print(f'analyzed {statistics.captured_bytes / 1e6:.1f} MB of debugger traffic in {elapsed:.3f}s')
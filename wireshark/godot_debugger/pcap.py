@@ -0,0 +1,255 @@
+# MIT License
+#
+# Copyright (c) 2022 Ammo Goettsch
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Streaming pcap and pcapng reader that only decodes as far as TCP
+import struct
+from dataclasses import dataclass
+from typing import BinaryIO, Iterator, List, Tuple
+
+# capture files are read in chunks this big, and packets are memoryviews into the chunks
+CHUNK_SIZE = 16 << 20
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86dd
+ETHERTYPE_VLAN = 0x8100
+
+PROTOCOL_TCP = 6
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+
+PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9),
+    b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    b'\xa1\xb2\x3c\x4d': ('>', 1e-9),
+}
+
+PCAPNG_SECTION_HEADER = 0x0a0d0d0a
+PCAPNG_BYTE_ORDER_MAGIC = 0x1a2b3c4d
+PCAPNG_INTERFACE_DESCRIPTION = 1
+PCAPNG_SIMPLE_PACKET = 3
+PCAPNG_ENHANCED_PACKET = 6
+PCAPNG_OPTION_END = 0
+PCAPNG_OPTION_TSRESOL = 9
+
+
+class CaptureError(ValueError):
+    pass
+
+
+@dataclass
+class TcpSegment:
+    timestamp: float
+    source: Tuple[bytes, int]
+    destination: Tuple[bytes, int]
+    sequence: int
+    flags: int
+    payload: memoryview
+
+
+class ChunkedReader:
+    def __init__(self, file: BinaryIO):
+        self.file = file
+        self.chunk = memoryview(b'')
+        self.position = 0
+
+    # returns None at the end of the file, including when the last record was cut off
+    def read(self, size: int) -> memoryview | None:
+        if len(self.chunk) - self.position < size:
+            tail = self.chunk[self.position:].tobytes()
+            self.chunk = memoryview(tail + self.file.read(max(CHUNK_SIZE, size - len(tail))))
+            self.position = 0
+            if len(self.chunk) < size:
+                return None
+        view = self.chunk[self.position:self.position + size]
+        self.position += size
+        return view
+
+
+# yields (timestamp in seconds, link type, frame) for each packet
+def read_packets(file: BinaryIO) -> Iterator[Tuple[float, int, memoryview]]:
+    reader = ChunkedReader(file)
+    magic = reader.read(4)
+    if magic is None:
+        return
+    if magic.tobytes() in PCAP_MAGIC:
+        yield from read_pcap(reader, *PCAP_MAGIC[magic.tobytes()])
+    elif struct.unpack('<I', magic)[0] == PCAPNG_SECTION_HEADER:
+        yield from read_pcapng(reader)
+    else:
+        raise CaptureError(f'not a pcap or pcapng file (magic {magic.hex()})')
+
+
+def read_pcap(reader: ChunkedReader, byte_order: str, resolution: float) -> Iterator[Tuple[float, int, memoryview]]:
+    header = reader.read(20)
+    if header is None:
+        return
+    _, _, _, _, _, link_type = struct.unpack(f'{byte_order}HHiIII', header)
+    record_header = struct.Struct(f'{byte_order}IIII')
+    while True:
+        record = reader.read(record_header.size)
+        if record is None:
+            return
+        seconds, fraction, captured_length, _ = record_header.unpack(record)
+        frame = reader.read(captured_length)
+        if frame is None:
+            return
+        yield seconds + fraction * resolution, link_type, frame
+
+
+def read_pcapng(reader: ChunkedReader) -> Iterator[Tuple[float, int, memoryview]]:
+    # the magic we already read was the block type of the first section header
+    block_type = PCAPNG_SECTION_HEADER
+    byte_order = '<'
+    interfaces = []
+    timestamp = 0.0
+    while True:
+        if block_type == PCAPNG_SECTION_HEADER:
+            # the byte order can change with every section
+            fields = reader.read(8)
+            if fields is None:
+                return
+            byte_order = '<' if struct.unpack('<I', fields[4:8])[0] == PCAPNG_BYTE_ORDER_MAGIC else '>'
+            block_length, = struct.unpack(f'{byte_order}I', fields[0:4])
+            if reader.read(block_length - 12) is None:
+                return
+            interfaces = []
+        else:
+            fields = reader.read(4)
+            if fields is None:
+                return
+            block_length, = struct.unpack(f'{byte_order}I', fields)
+            body = reader.read(block_length - 8)
+            if body is None:
+                return
+            if block_type == PCAPNG_ENHANCED_PACKET:
+                interface, high, low, captured_length, _ = struct.unpack_from(f'{byte_order}IIIII', body)
+                link_type, resolution = get_interface(interfaces, interface)
+                timestamp = ((high << 32) | low) * resolution
+                yield timestamp, link_type, body[20:20 + captured_length]
+            elif block_type == PCAPNG_SIMPLE_PACKET:
+                # no timestamp, so it gets the one from the previous packet
+                original_length, = struct.unpack_from(f'{byte_order}I', body)
+                link_type, _ = get_interface(interfaces, 0)
+                yield timestamp, link_type, body[4:4 + min(original_length, len(body) - 8)]
+            elif block_type == PCAPNG_INTERFACE_DESCRIPTION:
+                link_type, = struct.unpack_from(f'{byte_order}H', body)
+                interfaces.append((link_type, read_timestamp_resolution(body[8:-4], byte_order)))
+        block_header = reader.read(4)
+        if block_header is None:
+            return
+        block_type, = struct.unpack(f'{byte_order}I', block_header)
+
+
+# packets refer to the interface descriptions earlier in their section by index
+def get_interface(interfaces: List[Tuple[int, float]], interface: int) -> Tuple[int, float]:
+    if interface >= len(interfaces):
+        raise CaptureError(f'packet on interface {interface}, but the section only describes {len(interfaces)} interfaces')
+    return interfaces[interface]
+
+
+def read_timestamp_resolution(options: memoryview, byte_order: str) -> float:
+    position = 0
+    while position + 4 <= len(options):
+        code, length = struct.unpack_from(f'{byte_order}HH', options, position)
+        if code == PCAPNG_OPTION_END:
+            break
+        if code == PCAPNG_OPTION_TSRESOL and length >= 1:
+            value = options[position + 4]
+            if value & 0x80:
+                return 2.0 ** -(value & 0x7f)
+            return 10.0 ** -value
+        position += 4 + ((length + 3) & ~3)
+    return 1e-6
+
+
+# returns the IP packet in a link layer frame, or None if it isn't one
+def get_ip_packet(link_type: int, frame: memoryview) -> memoryview | None:
+    if link_type == LINKTYPE_ETHERNET:
+        ethertype_offset = 12
+        ethertype, = struct.unpack_from('>H', frame, ethertype_offset)
+        while ethertype == ETHERTYPE_VLAN:
+            ethertype_offset += 4
+            ethertype, = struct.unpack_from('>H', frame, ethertype_offset)
+        if ethertype != ETHERTYPE_IPV4 and ethertype != ETHERTYPE_IPV6:
+            return None
+        return frame[ethertype_offset + 2:]
+    elif link_type == LINKTYPE_NULL:
+        # loopback captures start with the address family in host byte order, the IP version is more reliable
+        return frame[4:]
+    elif link_type == LINKTYPE_LINUX_SLL:
+        return frame[16:]
+    elif link_type in [LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6]:
+        return frame
+    return None
+
+
+def get_tcp_segment(timestamp: float, link_type: int, frame: memoryview) -> TcpSegment | None:
+    try:
+        packet = get_ip_packet(link_type, frame)
+        if packet is None or len(packet) < 1:
+            return None
+        version = packet[0] >> 4
+        if version == 4:
+            header_length = (packet[0] & 0x0f) * 4
+            total_length, fragment, protocol = struct.unpack_from('>H2xHxB', packet, 2)
+            # fragments don't happen on the debugger connection, so they are not reassembled
+            if protocol != PROTOCOL_TCP or fragment & 0x3fff != 0:
+                return None
+            source_address = packet[12:16].tobytes()
+            destination_address = packet[16:20].tobytes()
+            # captured before segmentation offload, the total length can be 0, so the packet is the rest of the frame
+            if total_length < header_length:
+                total_length = len(packet)
+            tcp = packet[header_length:total_length]
+        elif version == 6:
+            payload_length, next_header = struct.unpack_from('>HB', packet, 4)
+            # extension headers don't happen on the debugger connection either
+            if next_header != PROTOCOL_TCP:
+                return None
+            source_address = packet[8:24].tobytes()
+            destination_address = packet[24:40].tobytes()
+            tcp = packet[40:40 + payload_length]
+        else:
+            return None
+        source_port, destination_port, sequence, offset_and_flags = struct.unpack_from('>HHI4xH', tcp)
+    except struct.error:
+        # truncated by the snap length
+        return None
+    return TcpSegment(timestamp, (source_address, source_port), (destination_address, destination_port),
+                      sequence, offset_and_flags & 0xff, tcp[(offset_and_flags >> 12) * 4:])
+
+
+def read_tcp_segments(file: BinaryIO) -> Iterator[TcpSegment]:
+    for timestamp, link_type, frame in read_packets(file):
+        segment = get_tcp_segment(timestamp, link_type, frame)
+        if segment is not None:
+            yield segment
@@ -0,0 +1,379 @@
+# MIT License
+#
+# Copyright (c) 2022 Ammo Goettsch
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Proxy between game and editor that measures the debugger connection while forwarding it unchanged
+import argparse
+import asyncio
+import struct
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import BinaryIO, Dict, Iterator, List, Tuple
+
+from .stream import MessageSplitter
+from .variant import FRAME_HEADER_SIZE
+
+GAME_TO_EDITOR = 0
+EDITOR_TO_GAME = 1
+DIRECTION_NAMES = ['game -> editor', 'editor -> game']
+
+READ_SIZE = 1 << 16
+
+# Recordings are this magic followed by records of (wall clock time, connection, kind, length) and that many bytes,
+# so they can be replayed through the same measurements later.  The kind of a record is the direction of the bytes
+# as they were forwarded, or marks a connection opening or closing, which carry the peer address as their bytes.
+RECORDING_MAGIC = b'GDBGREC2'
+RECORD_HEADER = struct.Struct('<dIBI')
+RECORD_OPEN = 2
+RECORD_CLOSE = 3
+
+
+# counts in power of two buckets, so long sessions use constant memory
+@dataclass
+class Histogram:
+    counts: List[int] = field(default_factory=lambda: [0] * 64)
+    total: int = 0
+    sum: int = 0
+    largest: int = 0
+
+    def add(self, value: int):
+        self.counts[value.bit_length()] += 1
+        self.total += 1
+        self.sum += value
+        self.largest = max(self.largest, value)
+
+    # upper bound of the bucket holding this fraction of the values
+    def percentile(self, fraction: float) -> int:
+        wanted = fraction * self.total
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count > 0 and seen >= wanted:
+                return min((1 << bucket) - 1, self.largest)
+        return self.largest
+
+    def merge(self, other: 'Histogram'):
+        for bucket, count in enumerate(other.counts):
+            self.counts[bucket] += count
+        self.total += other.total
+        self.sum += other.sum
+        self.largest = max(self.largest, other.largest)
+
+    def format_buckets(self) -> str:
+        return ' '.join(f'<{1 << bucket}:{count}' for bucket, count in enumerate(self.counts) if count > 0)
+
+
+@dataclass
+class CommandMeasurements:
+    sizes: Histogram = field(default_factory=Histogram)
+    # Microseconds from the head of the message arriving at the proxy until its last byte was drained to the
+    # receiver's socket.  This is the time the message spent in the proxy, including waiting for backpressure, not the
+    # round trip to a reply, because debugger messages carry no id to match replies with.
+    forwarding: Histogram = field(default_factory=Histogram)
+
+    def merge(self, other: 'CommandMeasurements'):
+        self.sizes.merge(other.sizes)
+        self.forwarding.merge(other.forwarding)
+
+
+@dataclass
+class BackpressureEvent:
+    timestamp: float
+    buffered: int
+    stall: float
+
+
+# measurements of one direction of one connection, or the total of several
+class DirectionMeasurements:
+    def __init__(self, name: str):
+        self.name = name
+        self.commands: Dict[str, CommandMeasurements] = {}
+        self.backpressure: List[BackpressureEvent] = []
+        self.messages = 0
+        self.bytes = 0
+        # (stream offset just past the message, command, arrival time) for messages not completely forwarded yet
+        self.in_flight: deque = deque()
+        self.forwarded = 0
+
+    def add_message(self, timestamp: float, offset: int, stream: int, size: int, command: str):
+        measurements = self.commands.get(command)
+        if measurements is None:
+            measurements = CommandMeasurements()
+            self.commands[command] = measurements
+        measurements.sizes.add(FRAME_HEADER_SIZE + size)
+        self.messages += 1
+        self.in_flight.append((offset + FRAME_HEADER_SIZE + size, command, timestamp))
+
+    def add_forwarded(self, length: int, timestamp: float):
+        self.forwarded += length
+        self.bytes += length
+        while len(self.in_flight) > 0 and self.in_flight[0][0] <= self.forwarded:
+            _, command, arrived = self.in_flight.popleft()
+            self.commands[command].forwarding.add(int((timestamp - arrived) * 1e6))
+
+    def merge(self, other: 'DirectionMeasurements'):
+        for command, measurements in other.commands.items():
+            self.commands.setdefault(command, CommandMeasurements()).merge(measurements)
+        self.backpressure.extend(other.backpressure)
+        self.messages += other.messages
+        self.bytes += other.bytes
+
+
+def create_directions() -> List[DirectionMeasurements]:
+    return [DirectionMeasurements(name) for name in DIRECTION_NAMES]
+
+
+def merge_directions(connections: List[List[DirectionMeasurements]]) -> List[DirectionMeasurements]:
+    totals = create_directions()
+    for directions in connections:
+        for total, direction in zip(totals, directions):
+            total.merge(direction)
+    return totals
+
+
+class DebuggerProxy:
+    def __init__(self, editor_host: str, editor_port: int, recording: BinaryIO | None):
+        self.editor_host = editor_host
+        self.editor_port = editor_port
+        self.recording = recording
+        # several games can be connected at once, e.g. when the editor runs multiple instances, and each connection is
+        # measured separately, because messages are matched up by their offset in the connection's byte streams
+        self.finished = create_directions()
+        self.connections: List[List[DirectionMeasurements]] = []
+        self.started = time.perf_counter()
+        self.next_connection = 0
+
+    def record(self, connection: int, kind: int, data: bytes):
+        if self.recording is not None:
+            self.recording.write(RECORD_HEADER.pack(time.time(), connection, kind, len(data)))
+            self.recording.write(data)
+
+    async def handle_game(self, game_reader: asyncio.StreamReader, game_writer: asyncio.StreamWriter):
+        try:
+            editor_reader, editor_writer = await asyncio.open_connection(self.editor_host, self.editor_port)
+        except OSError as error:
+            print(f'could not connect to editor at {self.editor_host}:{self.editor_port}: {error}')
+            game_writer.close()
+            return
+        peer = game_writer.get_extra_info("peername")
+        connection = self.next_connection
+        self.next_connection += 1
+        print(f'proxying connection {connection} from {peer} to {self.editor_host}:{self.editor_port}')
+        self.record(connection, RECORD_OPEN, str(peer).encode())
+        directions = create_directions()
+        self.connections.append(directions)
+        connected = time.perf_counter()
+        try:
+            await asyncio.gather(
+                self.pump(game_reader, editor_writer, directions, connection, GAME_TO_EDITOR),
+                self.pump(editor_reader, game_writer, directions, connection, EDITOR_TO_GAME))
+        finally:
+            editor_writer.close()
+            game_writer.close()
+            self.record(connection, RECORD_CLOSE, str(peer).encode())
+            self.connections.remove(directions)
+            for total, direction in zip(self.finished, directions):
+                total.merge(direction)
+        print()
+        print(f'connection {connection} from {peer} closed')
+        print_measurements(directions, time.perf_counter() - connected)
+
+    # all connections so far, including the ones still running
+    def get_totals(self) -> List[DirectionMeasurements]:
+        return merge_directions([self.finished] + self.connections)
+
+    # forwards bytes as they arrive, measuring them on the way without changing them
+    async def pump(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, directions: List[DirectionMeasurements],
+                   connection: int, direction_index: int):
+        direction = directions[direction_index]
+        splitter = MessageSplitter(direction.add_message)
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                arrived = time.perf_counter()
+                writer.write(data)
+                self.record(connection, direction_index, data)
+                splitter.feed(memoryview(data), arrived)
+                buffered = writer.transport.get_write_buffer_size()
+                if buffered > writer.transport.get_write_buffer_limits()[1]:
+                    # the receiver is not keeping up, so drain stops reading from the sender until it does
+                    stalled = time.perf_counter()
+                    await writer.drain()
+                    drained = time.perf_counter()
+                    direction.backpressure.append(BackpressureEvent(stalled - self.started, buffered, drained - stalled))
+                else:
+                    await writer.drain()
+                    drained = time.perf_counter()
+                direction.add_forwarded(len(data), drained)
+            # the other direction may still have replies to forward, so only pass on the half close
+            if writer.can_write_eof():
+                writer.write_eof()
+        except ConnectionError:
+            writer.close()
+
+    async def report_periodically(self, interval: float):
+        last = [(direction.messages, direction.bytes) for direction in self.get_totals()]
+        while True:
+            await asyncio.sleep(interval)
+            totals = self.get_totals()
+            current = [(direction.messages, direction.bytes) for direction in totals]
+            print(' | '.join(f'{direction.name}: {(messages - last_messages) / interval:.0f} msg/s {(total - last_total) / interval:.0f} B/s {len(direction.backpressure)} stalls'
+                             for direction, (messages, total), (last_messages, last_total) in zip(totals, current, last))
+                  + f' | {len(self.connections)} connected')
+            last = current
+
+
+def print_measurements(directions: List[DirectionMeasurements], duration: float):
+    span = max(duration, 1e-6)
+    for direction in directions:
+        print()
+        print(f'{direction.name}: {direction.messages} messages, {direction.bytes} bytes, {direction.messages / span:.1f} msg/s, {direction.bytes / span:.1f} B/s')
+        if direction.messages < 1:
+            continue
+        print(f'  {"command":<40} {"messages":>10} {"bytes":>14} {"p50 size":>10} {"p99 size":>10} {"p50 fwd us":>11} {"p99 fwd us":>11} {"max fwd us":>11}')
+        for command, measurements in sorted(direction.commands.items(), key=lambda item: item[1].sizes.sum, reverse=True):
+            sizes = measurements.sizes
+            forwarding = measurements.forwarding
+            print(f'  {command:<40} {sizes.total:>10} {sizes.sum:>14} {sizes.percentile(0.5):>10} {sizes.percentile(0.99):>10} '
+                  f'{forwarding.percentile(0.5):>11} {forwarding.percentile(0.99):>11} {forwarding.largest:>11}')
+            print(f'      sizes {sizes.format_buckets()}')
+        if len(direction.backpressure) > 0:
+            stalls = sorted(direction.backpressure, key=lambda event: event.stall, reverse=True)
+            print(f'  {len(stalls)} backpressure stalls, {sum(event.stall for event in stalls):.3f}s in total, longest:')
+            for event in stalls[:10]:
+                print(f'    {event.stall * 1e3:10.3f}ms at {event.timestamp:.3f}s with {event.buffered} bytes buffered')
+
+
+def read_recording(file: BinaryIO) -> Iterator[Tuple[float, int, int, bytes]]:
+    if file.read(len(RECORDING_MAGIC)) != RECORDING_MAGIC:
+        raise ValueError('not a debugger proxy recording')
+    while True:
+        header = file.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return
+        timestamp, connection, kind, length = RECORD_HEADER.unpack(header)
+        data = file.read(length)
+        if len(data) < length:
+            return
+        yield timestamp, connection, kind, data
+
+
+# one connection being replayed, with a splitter per direction because each is its own byte stream
+class ReplayedConnection:
+    def __init__(self, opened: float):
+        self.opened = opened
+        self.directions = create_directions()
+        self.splitters = [MessageSplitter(direction.add_message) for direction in self.directions]
+
+
+# Measures a recording as if it was being proxied.  There is no forwarding to measure, so forwarding time is only the
+# time over which each message arrived.
+def replay_recording(path: str) -> List[DirectionMeasurements]:
+    totals = create_directions()
+    connections: Dict[int, ReplayedConnection] = {}
+    first = None
+    last = None
+    print(path)
+    with open(path, 'rb') as recording:
+        for timestamp, connection, kind, data in read_recording(recording):
+            first = timestamp if first is None else first
+            last = timestamp
+            if kind == RECORD_OPEN:
+                connections[connection] = ReplayedConnection(timestamp)
+            elif kind == RECORD_CLOSE:
+                replayed = connections.pop(connection, None)
+                if replayed is None:
+                    continue
+                print()
+                print(f'connection {connection} from {data.decode()} closed')
+                print_measurements(replayed.directions, timestamp - replayed.opened)
+                for total, direction in zip(totals, replayed.directions):
+                    total.merge(direction)
+            else:
+                replayed = connections.get(connection)
+                if replayed is None:
+                    # the recording ended badly or was edited, so there is no telling where messages start
+                    continue
+                replayed.splitters[kind].feed(memoryview(data), timestamp)
+                replayed.directions[kind].add_forwarded(len(data), timestamp)
+    # connections still open when the recording stopped
+    for replayed in connections.values():
+        for total, direction in zip(totals, replayed.directions):
+            total.merge(direction)
+    print()
+    print('all connections')
+    print_measurements(totals, 0.0 if first is None else last - first)
+    return totals
+
+
+async def serve(options):
+    recording = None
+    if options.record:
+        recording = open(options.record, 'wb', buffering=1 << 20)
+        recording.write(RECORDING_MAGIC)
+    proxy = DebuggerProxy(options.editor_host, options.editor_port, recording)
+    server = await asyncio.start_server(proxy.handle_game, options.listen_host, options.listen_port)
+    print(f'listening for the game on {options.listen_host}:{options.listen_port}, forwarding to the editor at {options.editor_host}:{options.editor_port}')
+    reporter = None
+    if options.interval > 0:
+        reporter = asyncio.create_task(proxy.report_periodically(options.interval))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+        if recording is not None:
+            recording.close()
+        print()
+        print('all connections')
+        print_measurements(proxy.get_totals(), time.perf_counter() - proxy.started)
+
+
+def main():
+    command_line = argparse.ArgumentParser(
+        prog='python -m godot_debugger.proxy',
+        description="Forward the Godot debugger connection from game to editor unchanged, measuring message sizes, forwarding time and backpressure per command",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    command_line.add_argument('--listen-host', type=str, default='127.0.0.1', help='address the game connects to')
+    command_line.add_argument('--listen-port', type=int, default=6007,
+                              help='port the game connects to; this is the editor\'s normal debugger port, so change the editor\'s port to --editor-port')
+    command_line.add_argument('--editor-host', type=str, default='127.0.0.1', help='address of the editor')
+    command_line.add_argument('--editor-port', type=int, default=6008, help='port the editor listens on')
+    command_line.add_argument('--record', type=str, help='write everything forwarded to this file, for measuring again later with --replay')
+    command_line.add_argument('--replay', type=str, help='measure a recording instead of proxying')
+    command_line.add_argument('--interval', type=float, default=0.0, help='print message and byte rates every this many seconds')
+    options = command_line.parse_args()
+
+    if options.replay:
+        replay_recording(options.replay)
+        return
+    try:
+        asyncio.run(serve(options))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+# MIT License
+#
+# Copyright (c) 2022 Ammo Goettsch
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Stand-ins for game and editor, to exercise the proxy without Godot
+import argparse
+import asyncio
+import time
+
+from .stream import MessageSplitter
+from .variant import encode_message
+
+READ_SIZE = 1 << 16
+
+
+# Editor that reads slowly, so the proxy sees backpressure, and answers every message it receives.
+class StandinEditor:
+    def __init__(self, stall: float, read_delay: float):
+        # seconds before the editor starts reading from a new connection, like an editor busy loading a scene
+        self.stall = stall
+        # seconds between reads after that
+        self.read_delay = read_delay
+        self.messages = 0
+        self.bytes = 0
+
+    async def handle_game(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        def on_message(timestamp: float, offset: int, stream: int, size: int, command: str):
+            self.messages += 1
+            writer.write(encode_message('standin:reply', [command, size]))
+
+        splitter = MessageSplitter(on_message)
+        await asyncio.sleep(self.stall)
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                self.bytes += len(data)
+                splitter.feed(memoryview(data), time.perf_counter())
+                await writer.drain()
+                if self.read_delay > 0:
+                    await asyncio.sleep(self.read_delay)
+        except ConnectionError:
+            pass
+        writer.close()
+
+
+# Game that sends messages of the given payload size as fast as the connection takes them, then waits for all replies.
+# Returns the number of replies.
+async def run_game(host: str, port: int, messages: int, size: int, command: str = 'standin:data') -> int:
+    reader, writer = await asyncio.open_connection(host, port)
+    message = encode_message(command, [bytes(size)])
+    for _ in range(messages):
+        writer.write(message)
+        await writer.drain()
+    writer.write_eof()
+    replies = 0
+
+    def on_reply(timestamp: float, offset: int, stream: int, payload_size: int, reply: str):
+        nonlocal replies
+        replies += 1
+
+    splitter = MessageSplitter(on_reply)
+    while True:
+        data = await reader.read(READ_SIZE)
+        if not data:
+            break
+        splitter.feed(memoryview(data), time.perf_counter())
+    writer.close()
+    return replies
+
+
+async def serve_editor(options):
+    editor = StandinEditor(options.stall, options.read_delay)
+    server = await asyncio.start_server(editor.handle_game, options.host, options.port)
+    print(f'stand-in editor listening on {options.host}:{options.port}')
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    command_line = argparse.ArgumentParser(
+        prog='python -m godot_debugger.standin',
+        description='Stand-in editor and game for exercising the proxy without Godot',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    command_line.add_argument('role', choices=['editor', 'game'], help='which end of the debugger connection to play')
+    command_line.add_argument('--host', type=str, default='127.0.0.1', help='address to listen on as the editor, or to connect to as the game')
+    command_line.add_argument('--port', type=int, help='port to listen on as the editor, or to connect to as the game (default: 6008 for the editor, 6007 for the game)')
+    command_line.add_argument('--stall', type=float, default=1.0, help='editor: seconds to wait before reading from a new connection')
+    command_line.add_argument('--read-delay', type=float, default=0.001, help='editor: seconds to wait between reads')
+    command_line.add_argument('--messages', type=int, default=1000, help='game: number of messages to send')
+    command_line.add_argument('--size', type=int, default=1 << 16, help='game: payload bytes per message')
+    options = command_line.parse_args()
+
+    try:
+        if options.role == 'editor':
+            options.port = 6008 if options.port is None else options.port
+            asyncio.run(serve_editor(options))
+        else:
+            options.port = 6007 if options.port is None else options.port
+            started = time.perf_counter()
+            replies = asyncio.run(run_game(options.host, options.port, options.messages, options.size))
+            print(f'sent {options.messages} messages, received {replies} replies in {time.perf_counter() - started:.3f}s')
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+# MIT License
+#
+# Copyright (c) 2022 Ammo Goettsch
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Splitting a byte stream into debugger messages, and reassembling that byte stream from captured TCP segments
+from typing import Callable, Dict
+
+from .pcap import TCP_SYN
+from .variant import FRAME_HEADER_SIZE, VariantError, decode_command, decode_frame_header
+
+# Only this much of each message is kept to decode its command.  The rest of a large message is skipped as it
+# arrives, so megabytes of scene data are never buffered.
+MESSAGE_HEAD_SIZE = 256
+
+# command reported for messages that don't decode
+UNDECODABLE_COMMAND = '<undecodable>'
+
+SEQUENCE_MASK = 0xffffffff
+SEQUENCE_HALF = 0x80000000
+
+# segments waiting for a missing one; if there are more than this, the missing one was not captured
+MAX_PENDING_SEGMENTS = 4096
+
+# called with (timestamp, offset of the message in the byte stream, stream, payload size, command) for every message
+MessageCallback = Callable[[float, int, int, int, str], None]
+
+
+class MessageSplitter:
+    def __init__(self, on_message: MessageCallback):
+        self.on_message = on_message
+        # start of a message that was split across feeds
+        self.pending = bytearray()
+        # bytes left to skip in the current message, after its command has been reported
+        self.skip = 0
+        # bytes fed before the current feed
+        self.offset = 0
+
+    def feed(self, data: memoryview, timestamp: float):
+        position = 0
+        end = len(data)
+        while position < end:
+            if self.skip > 0:
+                step = min(self.skip, end - position)
+                self.skip -= step
+                position += step
+            elif len(self.pending) > 0:
+                head_size = self.get_head_size(self.pending)
+                step = min(head_size - len(self.pending), end - position)
+                self.pending += data[position:position + step]
+                position += step
+                # the head size is only known once the frame header is complete
+                if len(self.pending) >= FRAME_HEADER_SIZE and len(self.pending) == self.get_head_size(self.pending):
+                    self.skip = self.report(memoryview(self.pending), self.offset + position - len(self.pending), timestamp)
+                    self.pending = bytearray()
+            else:
+                # common case, where the head of the message is all here and can be decoded in place
+                available = end - position
+                if available >= FRAME_HEADER_SIZE:
+                    _, size = decode_frame_header(data, position)
+                    if available >= FRAME_HEADER_SIZE + min(size, MESSAGE_HEAD_SIZE):
+                        self.report(data[position:], self.offset + position, timestamp)
+                        step = min(FRAME_HEADER_SIZE + size, available)
+                        self.skip = FRAME_HEADER_SIZE + size - step
+                        position += step
+                        continue
+                self.pending += data[position:]
+                break
+        self.offset += end
+
+    # size of the frame header plus as much of the payload as we decode
+    @staticmethod
+    def get_head_size(data) -> int:
+        if len(data) < FRAME_HEADER_SIZE:
+            return FRAME_HEADER_SIZE
+        _, size = decode_frame_header(data)
+        return FRAME_HEADER_SIZE + min(size, MESSAGE_HEAD_SIZE)
+
+    # reports the message starting at data and returns how many of its bytes are beyond the head
+    def report(self, data: memoryview, offset: int, timestamp: float) -> int:
+        stream, size = decode_frame_header(data)
+        head_size = min(size, MESSAGE_HEAD_SIZE)
+        try:
+            command = decode_command(data[FRAME_HEADER_SIZE:FRAME_HEADER_SIZE + head_size])
+        except VariantError:
+            command = UNDECODABLE_COMMAND
+        self.on_message(timestamp, offset, stream, size, command)
+        return size - head_size
+
+
+# One direction of a captured TCP connection, delivering the bytes in order.  If the capture started after the
+# connection was made, or lost a segment, message boundaries are unknown, so the rest of the direction is ignored.
+class TcpStream:
+    def __init__(self, splitter: MessageSplitter):
+        self.splitter = splitter
+        self.next_sequence: int | None = None
+        self.pending: Dict[int, memoryview] = {}
+        self.ignored_bytes = 0
+        self.lost = False
+
+    def feed(self, sequence: int, flags: int, payload: memoryview, timestamp: float):
+        if flags & TCP_SYN:
+            if not self.lost:
+                self.next_sequence = (sequence + 1) & SEQUENCE_MASK
+            return
+        if len(payload) == 0:
+            return
+        if self.next_sequence is None:
+            self.ignored_bytes += len(payload)
+            return
+
+        ahead = (sequence - self.next_sequence) & SEQUENCE_MASK
+        if ahead >= SEQUENCE_HALF:
+            # retransmission, possibly with some new data at the end
+            behind = (self.next_sequence - sequence) & SEQUENCE_MASK
+            if behind >= len(payload):
+                return
+            payload = payload[behind:]
+        elif ahead > 0:
+            if len(payload) > len(self.pending.get(sequence, b'')):
+                self.pending[sequence] = payload
+            if len(self.pending) > MAX_PENDING_SEGMENTS:
+                self.lose()
+            return
+
+        self.deliver(payload, timestamp)
+        while len(self.pending) > 0:
+            payload = self.pending.pop(self.next_sequence, None)
+            if payload is None:
+                payload = self.pop_overlapping()
+                if payload is None:
+                    return
+            self.deliver(payload, timestamp)
+
+    # removes pending segments that start before the next byte, and returns the new data from one of them
+    def pop_overlapping(self) -> memoryview | None:
+        for sequence in list(self.pending.keys()):
+            behind = (self.next_sequence - sequence) & SEQUENCE_MASK
+            if behind < SEQUENCE_HALF:
+                payload = self.pending.pop(sequence)
+                if behind < len(payload):
+                    return payload[behind:]
+        return None
+
+    def deliver(self, payload: memoryview, timestamp: float):
+        self.next_sequence = (self.next_sequence + len(payload)) & SEQUENCE_MASK
+        self.splitter.feed(payload, timestamp)
+
+    def lose(self):
+        self.ignored_bytes += sum(len(payload) for payload in self.pending.values())
+        self.pending = {}
+        self.next_sequence = None
+        self.lost = True
@@ -0,0 +1,165 @@
+# MIT License
+#
+# Copyright (c) 2022 Ammo Goettsch
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Godot RemoteDebugger wire format (size field followed by encoded Variant), same as GodotDebuggerMarshalls.lua
+import struct
+from typing import Any, List, Tuple
+
+ENCODED_AS_64BIT = 0x10000
+
+# the Variant types the dissector understands
+BOOL = 1
+INT = 2
+STRING = 4
+ARRAY = 25
+PACKED_BYTE_ARRAY = 26
+
+TYPE_NAMES = {
+    BOOL: 'BOOL',
+    INT: 'INT',
+    STRING: 'STRING',
+    ARRAY: 'ARRAY',
+    PACKED_BYTE_ARRAY: 'PACKED_BYTE_ARRAY',
+}
+
+# size of the frame header: 24 bit payload size with the stream number in the top byte
+FRAME_HEADER_SIZE = 4
+
+UINT32 = struct.Struct('<I')
+INT32 = struct.Struct('<i')
+INT64 = struct.Struct('<q')
+
+
+class VariantError(ValueError):
+    pass
+
+
+def decode_frame_header(buffer: memoryview, offset: int = 0) -> Tuple[int, int]:
+    size_field, = UINT32.unpack_from(buffer, offset)
+    return (size_field >> 24) & 0xff, size_field & 0xffffff
+
+
+def get_type_name(variant_type: int) -> str:
+    return TYPE_NAMES.get(variant_type, str(variant_type))
+
+
+# Decodes the Variant at offset and returns it with the offset just past it.  STRING becomes str and ARRAY becomes
+# list, but PACKED_BYTE_ARRAY is returned as a memoryview into the buffer, so large payloads are never copied.
+def decode_variant(buffer: memoryview, offset: int = 0) -> Tuple[Any, int]:
+    variant_type = read_uint32(buffer, offset)
+    offset += 4
+    is_64_bit = variant_type & ENCODED_AS_64BIT != 0
+    variant_type &= ~ENCODED_AS_64BIT
+    if variant_type == ARRAY:
+        size = read_uint32(buffer, offset)
+        offset += 4
+        items = []
+        for _ in range(size):
+            item, offset = decode_variant(buffer, offset)
+            items.append(item)
+        return items, offset
+    elif variant_type == STRING:
+        text, end = read_padded_bytes(buffer, offset)
+        return str(text, 'utf-8', errors='replace'), end
+    elif variant_type == PACKED_BYTE_ARRAY:
+        return read_padded_bytes(buffer, offset)
+    elif variant_type == INT:
+        if is_64_bit:
+            return read_struct(INT64, buffer, offset), offset + 8
+        return read_struct(INT32, buffer, offset), offset + 4
+    elif variant_type == BOOL:
+        if is_64_bit:
+            # doesn't happen, but would be legal
+            return read_struct(INT64, buffer, offset) != 0, offset + 8
+        return read_uint32(buffer, offset) != 0, offset + 4
+    raise VariantError(f'unsupported Variant type {get_type_name(variant_type)} at offset {offset - 4}')
+
+
+# Messages are an ARRAY whose first element is the command STRING.  Returns the command and the remaining elements.
+def decode_message(payload: memoryview) -> Tuple[str, List[Any]]:
+    message, _ = decode_variant(payload)
+    if not isinstance(message, list) or len(message) < 1 or not isinstance(message[0], str):
+        raise VariantError('message is not an ARRAY starting with a command STRING')
+    return message[0], message[1:]
+
+
+# Reads just the command without decoding the rest of the message, so it also works on the start of a message.
+def decode_command(payload: memoryview) -> str:
+    if read_uint32(payload, 0) & ~ENCODED_AS_64BIT != ARRAY:
+        raise VariantError('message is not an ARRAY')
+    if read_uint32(payload, 4) < 1:
+        raise VariantError('message is empty')
+    if read_uint32(payload, 8) & ~ENCODED_AS_64BIT != STRING:
+        raise VariantError('message does not start with a command STRING')
+    command, _ = read_padded_bytes(payload, 12)
+    return str(command, 'utf-8', errors='replace')
+
+
+# Encodes bool, int, str, list and bytes as the Variant types above, to make messages for the tests and the stand-in
+# game and editor.
+def encode_variant(value: Any) -> bytes:
+    if isinstance(value, bool):
+        return UINT32.pack(BOOL) + UINT32.pack(int(value))
+    if isinstance(value, int):
+        if -0x80000000 <= value <= 0x7fffffff:
+            return UINT32.pack(INT) + INT32.pack(value)
+        return UINT32.pack(INT | ENCODED_AS_64BIT) + INT64.pack(value)
+    if isinstance(value, str):
+        return UINT32.pack(STRING) + encode_padded_bytes(value.encode('utf-8'))
+    if isinstance(value, (list, tuple)):
+        return UINT32.pack(ARRAY) + UINT32.pack(len(value)) + b''.join(encode_variant(item) for item in value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return UINT32.pack(PACKED_BYTE_ARRAY) + encode_padded_bytes(bytes(value))
+    raise VariantError(f'cannot encode {type(value).__name__} as a Variant')
+
+
+# frame header and encoded message, as sent over the debugger connection
+def encode_message(command: str, arguments: List[Any], stream: int = 0) -> bytes:
+    payload = encode_variant([command] + arguments)
+    if len(payload) > 0xffffff:
+        raise VariantError(f'message of {len(payload)} bytes does not fit the frame header')
+    return UINT32.pack(stream << 24 | len(payload)) + payload
+
+
+def encode_padded_bytes(data: bytes) -> bytes:
+    return UINT32.pack(len(data)) + data + bytes(-len(data) & 3)
+
+
+def read_uint32(buffer: memoryview, offset: int) -> int:
+    return read_struct(UINT32, buffer, offset)
+
+
+def read_struct(layout: struct.Struct, buffer: memoryview, offset: int):
+    try:
+        value, = layout.unpack_from(buffer, offset)
+    except struct.error as error:
+        raise VariantError(f'truncated Variant at offset {offset}') from error
+    return value
+
+
+# size prefixed bytes padded to a multiple of 4, as used by STRING and PACKED_BYTE_ARRAY
+def read_padded_bytes(buffer: memoryview, offset: int) -> Tuple[memoryview, int]:
+    size = read_uint32(buffer, offset)
+    start = offset + 4
+    if start + size > len(buffer):
+        raise VariantError(f'truncated Variant at offset {offset}')
+    return buffer[start:start + size], start + ((size + 3) & ~3)
@@ -0,0 +1,168 @@
+# MIT License
+#
+# Copyright (c) 2022 Ammo Goettsch
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Decoding Variants, splitting messages and analyzing the captures in fixtures, which hold the same session of a game
+# on port 50000 talking to the editor on 6007 over loopback: scene:tree with a 3000 byte payload and
+# performance:profile_frame in three segments, the last one captured before the middle one and the first one
+# retransmitted, and scene:inspect_object on stream 1 from the editor.
+import io
+import pathlib
+import struct
+import unittest
+
+from godot_debugger.analyze import analyze_capture
+from godot_debugger.pcap import LINKTYPE_RAW, CaptureError, get_tcp_segment, read_packets, read_tcp_segments, TCP_SYN
+from godot_debugger.stream import MESSAGE_HEAD_SIZE, UNDECODABLE_COMMAND, MessageSplitter, TcpStream
+from godot_debugger.variant import VariantError, decode_command, decode_frame_header, decode_message, encode_message, encode_variant
+
+FIXTURES_PATH = pathlib.Path(__file__).parent / 'fixtures'
+
+
+def collect_messages(chunks) -> list:
+    messages = []
+    splitter = MessageSplitter(lambda timestamp, offset, stream, size, command: messages.append((offset, stream, size, command)))
+    for chunk in chunks:
+        splitter.feed(memoryview(chunk), 0.0)
+    return messages
+
+
+class VariantTest(unittest.TestCase):
+    def test_decode_message(self):
+        # ["scene:tree", 7, true, PackedByteArray(3 bytes)] as the game sends it
+        payload = struct.pack('<II', 25, 4) + struct.pack('<II', 4, 10) + b'scene:tree\0\0' + struct.pack('<Ii', 2, 7) \
+            + struct.pack('<II', 1, 1) + struct.pack('<II', 26, 3) + b'abc\0'
+        command, arguments = decode_message(memoryview(payload))
+        self.assertEqual(command, 'scene:tree')
+        self.assertEqual(arguments[:2], [7, True])
+        self.assertEqual(bytes(arguments[2]), b'abc')
+        self.assertEqual(encode_variant(['scene:tree', 7, True, b'abc']), payload)
+
+    def test_64_bit_int(self):
+        payload = encode_variant(['x', -(1 << 40)])
+        self.assertEqual(struct.unpack_from('<I', payload, 20)[0], 0x10002)
+        self.assertEqual(decode_message(memoryview(payload)), ('x', [-(1 << 40)]))
+
+    def test_frame_header(self):
+        message = encode_message('scene:inspect_object', [42], stream=1)
+        self.assertEqual(decode_frame_header(memoryview(message)), (1, len(message) - 4))
+
+    def test_decode_command_from_head(self):
+        message = encode_message('scene:tree', [bytes(1000)])
+        self.assertEqual(decode_command(memoryview(message)[4:40]), 'scene:tree')
+
+    def test_errors(self):
+        with self.assertRaises(VariantError):
+            decode_message(memoryview(encode_variant([1, 'not a command'])))
+        with self.assertRaises(VariantError):
+            decode_message(memoryview(encode_variant(['truncated', 'text'])[:-4]))
+        with self.assertRaises(VariantError):
+            decode_message(memoryview(struct.pack('<II', 25, 1) + struct.pack('<I', 3) + bytes(4)))
+
+
+class MessageSplitterTest(unittest.TestCase):
+    def setUp(self):
+        self.data = encode_message('scene:tree', [bytes(10000)]) + encode_message('debug_enter', [True, 'breakpoint']) \
+            + encode_message('output', [['line']], stream=2)
+        self.expected = collect_messages([self.data])
+
+    def test_whole_stream(self):
+        self.assertEqual([command for _, _, _, command in self.expected], ['scene:tree', 'debug_enter', 'output'])
+        self.assertEqual(self.expected[1][0], 4 + self.expected[0][2])
+        self.assertEqual(self.expected[2][1], 2)
+
+    def test_byte_by_byte(self):
+        self.assertEqual(collect_messages(self.data[position:position + 1] for position in range(len(self.data))), self.expected)
+
+    def test_split_in_header_and_head(self):
+        for split in [2, 4, 20, 4 + MESSAGE_HEAD_SIZE, 5000, len(self.data) - 3]:
+            self.assertEqual(collect_messages([self.data[:split], self.data[split:]]), self.expected, split)
+
+    def test_undecodable(self):
+        data = struct.pack('<I', 8) + struct.pack('<II', 2, 5) + encode_message('output', [])
+        self.assertEqual([command for _, _, _, command in collect_messages([data])], [UNDECODABLE_COMMAND, 'output'])
+
+
+class TcpStreamTest(unittest.TestCase):
+    def test_capture_started_late(self):
+        messages = []
+        stream = TcpStream(MessageSplitter(lambda *message: messages.append(message)))
+        stream.feed(100, 0, memoryview(encode_message('output', [])), 0.0)
+        self.assertEqual(messages, [])
+        self.assertGreater(stream.ignored_bytes, 0)
+
+    def test_reordered_segments(self):
+        data = encode_message('scene:tree', [bytes(3000)])
+        messages = []
+        stream = TcpStream(MessageSplitter(lambda *message: messages.append(message)))
+        stream.feed(0, TCP_SYN, memoryview(b''), 0.0)
+        stream.feed(2001, 0, memoryview(data[2000:]), 0.0)
+        stream.feed(1, 0, memoryview(data[:1000]), 0.0)
+        stream.feed(1001, 0, memoryview(data[1000:2000]), 0.0)
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(stream.ignored_bytes, 0)
+
+
+class CaptureTest(unittest.TestCase):
+    def test_packets(self):
+        for name in ['session.pcap', 'session.pcapng']:
+            with open(FIXTURES_PATH / name, 'rb') as capture:
+                timestamps = [timestamp for timestamp, _, _ in read_packets(capture)]
+            self.assertEqual(len(timestamps), 8, name)
+            self.assertAlmostEqual(timestamps[1] - timestamps[0], 0.001, places=6, msg=name)
+            with open(FIXTURES_PATH / name, 'rb') as capture:
+                segments = list(read_tcp_segments(capture))
+            self.assertEqual([segment.destination[1] for segment in segments], [6007, 50000, 6007, 6007, 6007, 6007, 50000, 6007], name)
+
+    def test_analyze(self):
+        for name in ['session.pcap', 'session.pcapng']:
+            statistics = analyze_capture(str(FIXTURES_PATH / name), [6007])
+            commands = {direction.name.split(' (')[0]: {command: (statistics.messages, statistics.bytes) for command, statistics in direction.commands.items()}
+                        for direction in statistics.directions.values()}
+            self.assertEqual(commands, {
+                'game -> editor': {'scene:tree': (1, 3040), 'performance:profile_frame': (1, 72)},
+                'editor -> game': {'scene:inspect_object': (1, 48)},
+            }, name)
+            self.assertTrue(all(stream.ignored_bytes == 0 for stream in statistics.streams.values()), name)
+
+    def test_other_port(self):
+        statistics = analyze_capture(str(FIXTURES_PATH / 'session.pcap'), [6008])
+        self.assertEqual(statistics.directions, {})
+
+    def test_zero_total_length(self):
+        # as captured on the sending side before segmentation offload fills in the total length
+        payload = encode_message('output', [['line']])
+        tcp = struct.pack('>HHIIHHHH', 50000, 6007, 1000, 0, (5 << 12) | 0x18, 0xffff, 0, 0) + payload
+        ip = struct.pack('>BBHHHBBH4s4s', 0x45, 0, 0, 0, 0x4000, 64, 6, 0, bytes([127, 0, 0, 1]), bytes([127, 0, 0, 1]))
+        segment = get_tcp_segment(0.0, LINKTYPE_RAW, memoryview(ip + tcp))
+        self.assertEqual(segment.destination[1], 6007)
+        self.assertEqual(segment.sequence, 1000)
+        self.assertEqual(bytes(segment.payload), payload)
+
+    def test_packet_without_interface(self):
+        section_header = struct.pack('<IIIHHqI', 0x0a0d0d0a, 28, 0x1a2b3c4d, 1, 0, -1, 28)
+        packet = struct.pack('<IIIIIII', 6, 36, 0, 0, 0, 4, 4) + bytes(4) + struct.pack('<I', 36)
+        with self.assertRaisesRegex(CaptureError, 'interface 0'):
+            list(read_packets(io.BytesIO(section_header + packet)))
+
+
+if __name__ == '__main__':
+    unittest.main()
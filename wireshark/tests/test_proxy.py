@@ -0,0 +1,89 @@
+# MIT License
+#
+# Copyright (c) 2022 Ammo Goettsch
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Runs the proxy between the stand-in game and editor
+import asyncio
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from godot_debugger.proxy import DebuggerProxy, EDITOR_TO_GAME, GAME_TO_EDITOR, RECORDING_MAGIC, replay_recording
+from godot_debugger.standin import StandinEditor, run_game
+
+
+async def run_session(editor: StandinEditor, games: list, recording=None) -> DebuggerProxy:
+    editor_server = await asyncio.start_server(editor.handle_game, '127.0.0.1', 0)
+    proxy = DebuggerProxy('127.0.0.1', editor_server.sockets[0].getsockname()[1], recording)
+    proxy_server = await asyncio.start_server(proxy.handle_game, '127.0.0.1', 0)
+    port = proxy_server.sockets[0].getsockname()[1]
+    async with editor_server, proxy_server:
+        replies = await asyncio.gather(*(run_game('127.0.0.1', port, messages, size) for messages, size in games))
+        # the proxy finishes the connection after the game has seen it close
+        while len(proxy.connections) > 0:
+            await asyncio.sleep(0.01)
+    assert replies == [messages for messages, _ in games]
+    return proxy
+
+
+class ProxyTest(unittest.TestCase):
+    def test_backpressure(self):
+        # far more than the socket buffers hold while the editor isn't reading
+        editor = StandinEditor(stall=0.5, read_delay=0.0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            proxy = asyncio.run(run_session(editor, [(300, 1 << 16)]))
+        totals = proxy.get_totals()
+        game_to_editor = totals[GAME_TO_EDITOR]
+        self.assertEqual(game_to_editor.messages, 300)
+        self.assertEqual(editor.messages, 300)
+        self.assertGreater(len(game_to_editor.backpressure), 0)
+        # the first stall lasts until the editor starts reading
+        self.assertGreater(max(event.stall for event in game_to_editor.backpressure), 0.1)
+        forwarding = game_to_editor.commands['standin:data'].forwarding
+        self.assertEqual(forwarding.total, 300)
+        self.assertGreater(forwarding.largest, 100000)
+        self.assertEqual(totals[EDITOR_TO_GAME].commands['standin:reply'].sizes.total, 300)
+
+    def test_concurrent_connections_are_replayed_separately(self):
+        editor = StandinEditor(stall=0.0, read_delay=0.0)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'session.gdbgrec')
+            with open(path, 'wb') as recording:
+                recording.write(RECORDING_MAGIC)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    proxy = asyncio.run(run_session(editor, [(50, 1000), (70, 3000)], recording))
+            with contextlib.redirect_stdout(io.StringIO()) as output:
+                replayed = replay_recording(path)
+        self.assertEqual(output.getvalue().count(' closed'), 2)
+        live = proxy.get_totals()
+        for direction in (GAME_TO_EDITOR, EDITOR_TO_GAME):
+            self.assertEqual(replayed[direction].messages, 120)
+            self.assertEqual(replayed[direction].bytes, live[direction].bytes)
+            self.assertEqual(list(replayed[direction].commands), list(live[direction].commands))
+        data = replayed[GAME_TO_EDITOR].commands['standin:data'].sizes
+        self.assertEqual(data.total, 120)
+        self.assertEqual(data.largest, 4 + 36 + 3000)
+
+
+if __name__ == '__main__':
+    unittest.main()